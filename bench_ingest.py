@@ -0,0 +1,157 @@
+"""
+Ingestion load test: runs the three fetchers against mock_api_server.py
+and reports requests/s, rows/s and p50/p99 request latency (upper bounds
+of metrics.py's latency buckets).
+
+Everything runs offline in a temporary directory; the response cache is
+switched off so every request reaches the mock server.
+
+Usage:
+    python bench_ingest.py
+    python bench_ingest.py --days 14 --airports JFK,LGA,EWR --latency-ms 30 --output bench_output.txt
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+import mock_api_server
+import response_cache
+from ingest_client import get_client
+from metrics import get_metrics, bucket_percentile
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROVIDERS = ["aviationstack", "weatherstack", "marketstack"]
+
+
+def load_script(name, filename):
+    # the fetch scripts have parentheses in their names, so import them by path
+    spec = importlib.util.spec_from_file_location(name, os.path.join(BASE_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def count_rows(db_path, table):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def run_scenario(name, provider, func, db_path, table, verbose=False):
+    metrics = get_metrics()
+    metrics.clear_api(provider)
+
+    started = time.perf_counter()
+    if verbose:
+        func()
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+    elapsed = time.perf_counter() - started
+
+    counts, requests_made, _, longest = metrics.api_latency(provider)
+    rows = count_rows(db_path, table)
+    return {
+        "scenario": name,
+        "requests": requests_made,
+        "rows": rows,
+        "seconds": elapsed,
+        "req_per_s": requests_made / elapsed if elapsed else 0.0,
+        "rows_per_s": rows / elapsed if elapsed else 0.0,
+        "p50_ms": bucket_percentile(counts, 0.50, longest * 1000) or 0.0,
+        "p99_ms": bucket_percentile(counts, 0.99, longest * 1000) or 0.0,
+    }
+
+
+def format_results(results, args):
+    lines = [
+        f"Ingest benchmark (mock server: latency={args.latency_ms}ms, rate_limit={args.server_rate_limit}/s, "
+        f"error_rate={args.error_rate}, seed={args.seed})",
+        f"{'Scenario':<18} | {'Requests':>8} | {'Rows':>7} | {'Seconds':>7} | {'Req/s':>7} | "
+        f"{'Rows/s':>9} | {'p50 ms':>7} | {'p99 ms':>7}",
+        "-" * 92,
+    ]
+    for r in results:
+        lines.append(f"{r['scenario']:<18} | {r['requests']:>8} | {r['rows']:>7} | {r['seconds']:>7.2f} | "
+                     f"{r['req_per_s']:>7.1f} | {r['rows_per_s']:>9.1f} | {r['p50_ms']:>7.1f} | {r['p99_ms']:>7.1f}")
+    return "\n".join(lines)
+
+
+def run_benchmark(args):
+    server, base_url = mock_api_server.start_server(
+        port=0, seed=args.seed, latency_ms=args.latency_ms,
+        rate_limit=args.server_rate_limit, error_rate=args.error_rate)
+
+    response_cache.get_cache().mode = "off"
+    client = get_client()
+    for provider in PROVIDERS:
+        client.set_base_url(provider, base_url)
+        client.set_rate_limit(provider, args.client_rate_limit, args.client_rate_limit)
+
+    flights = load_script("bench_fetch_flight", "fetch_flight_data(Ke).py")
+    weather = load_script("bench_fetch_weather", "fetch_weather_data(Zuming).py")
+    stocks = load_script("bench_fetch_stock", "fetch_stock_data(Ronghao).py")
+
+    start = date(2025, 9, 1)
+    end = start + timedelta(days=args.days - 1)
+    airports = args.airports.split(",")
+    locations = args.locations.split(",")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        flight_db = os.path.join(tmp, "flight_data.db")
+        weather_db = os.path.join(tmp, "weather_data.db")
+        stock_db = os.path.join(tmp, "stock_data.db")
+
+        results.append(run_scenario(
+            "flights backfill", "aviationstack",
+            lambda: flights.backfill_flights("bench-key", airports, start, end, db_path=flight_db,
+                                             max_workers=args.workers),
+            flight_db, "flight_history", args.verbose))
+        results.append(run_scenario(
+            "weather backfill", "weatherstack",
+            lambda: weather.backfill_weather("bench-key", locations, db_path=weather_db,
+                                             start_date=date(2025, 1, 1), end_date=date(2025, 12, 12),
+                                             max_workers=args.workers),
+            weather_db, "weather_history", args.verbose))
+        results.append(run_scenario(
+            "stock range", "marketstack",
+            lambda: stocks.fetch_stock_data_range("bench-key", db_path=stock_db),
+            stock_db, "stock_history", args.verbose))
+
+    server.shutdown()
+    server.server_close()
+    for provider in PROVIDERS:
+        client.set_base_url(provider, None)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the fetchers against the mock API server")
+    parser.add_argument("--days", type=int, default=7, help="days of flights to backfill")
+    parser.add_argument("--airports", default="JFK,LGA")
+    parser.add_argument("--locations", default="New York,Boston")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--client-rate-limit", type=float, default=200, help="client token bucket, req/s")
+    parser.add_argument("--server-rate-limit", type=float, default=0, help="mock server limit, req/s (0 = off)")
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the fetchers' own output")
+    args = parser.parse_args()
+
+    report = format_results(run_benchmark(args), args)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
@@ -25,3 +25,13 @@ AVIATIONSTACK_BASE_URL = "http://api.aviationstack.com/v1"
 WEATHERSTACK_BASE_URL = "http://api.weatherstack.com"
 MARKETSTACK_BASE_URL = "http://api.marketstack.com/v1"
 
+
+# Per-provider request limits used by ingest_client.py (token bucket:
+# sustained requests per second, and how many may burst at once)
+AVIATIONSTACK_RATE_LIMIT = {"per_second": 5, "burst": 5}
+WEATHERSTACK_RATE_LIMIT = {"per_second": 2, "burst": 2}
+MARKETSTACK_RATE_LIMIT = {"per_second": 5, "burst": 5}
+
+# Weather location used for each airport when joining flights to weather
+# (daily_fact.py); airports not listed get no weather columns
+AIRPORT_LOCATIONS = {"JFK": "New York", "LGA": "New York", "EWR": "New York"}
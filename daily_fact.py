@@ -0,0 +1,177 @@
+"""
+daily_fact: one narrow row per (date, airport_code) in the merged database,
+joining flights, weather and stocks so cross-dataset questions don't have to
+re-join the raw tables.
+
+    daily_fact          flight_count, delay_count (flights with a non-negative
+                        delay), avg_delay_min, max_wind_speed, total_precip,
+                        severity_score, listed_flights (flights whose
+                        airline is in the airlines table and has a
+                        stock_history row that day), stock_return (their
+                        average return_percentage that day, weighted by
+                        flights)
+    daily_fact_airline  the same date/airport split per listed airline, with
+                        that airline's own return_percentage
+
+Weather comes from daily_weather_summary through AIRPORT_LOCATIONS in
+config.py. Each source table keeps an id high-water mark in daily_fact_state
+(flight_history, weather_hourly_days, stock_history; all AUTOINCREMENT), and
+a refresh rebuilds only the dates that have rows above those marks.
+weather_hourly_days logs every rewritten weather day, including ones
+rewritten to no hours (see weather_tables.py).
+    python daily_fact.py wzh_project.db
+"""
+
+import sqlite3
+import sys
+
+from config import AIRPORT_LOCATIONS
+from db_utils import create_index
+
+# source table whose new ids mark a date as touched -> its date column
+FACT_SOURCES = {
+    "flight_history": "record_date",
+    "weather_hourly_days": "record_date",
+    "stock_history": "record_date",
+}
+
+
+def table_exists(conn, name):
+    cur = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,))
+    return cur.fetchone() is not None
+
+
+def create_fact_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_fact (
+            date TEXT NOT NULL,
+            airport_code TEXT NOT NULL,
+            flight_count INTEGER NOT NULL,
+            delay_count INTEGER NOT NULL,
+            avg_delay_min REAL,
+            max_wind_speed INTEGER,
+            total_precip REAL,
+            severity_score REAL,
+            listed_flights INTEGER NOT NULL,
+            stock_return REAL,
+            PRIMARY KEY (date, airport_code)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_daily_fact_airport ON daily_fact(airport_code, date)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_fact_airline (
+            date TEXT NOT NULL,
+            airport_code TEXT NOT NULL,
+            airline_id INTEGER NOT NULL,
+            flight_count INTEGER NOT NULL,
+            avg_delay_min REAL,
+            return_percentage REAL,
+            PRIMARY KEY (date, airport_code, airline_id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_fact_state (
+            source_table TEXT PRIMARY KEY,
+            high_water INTEGER NOT NULL
+        )
+    ''')
+
+
+def touched_dates(conn):
+    """Dates with source rows above their high-water marks, plus the new marks."""
+    dates = set()
+    marks = {}
+    for table, date_col in FACT_SOURCES.items():
+        if not table_exists(conn, table):
+            continue
+        row = conn.execute("SELECT high_water FROM daily_fact_state WHERE source_table = ?", (table,)).fetchone()
+        high_water = row[0] if row else 0
+        new_high_water = conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 0
+        if new_high_water > high_water:
+            dates.update(r[0] for r in conn.execute(
+                f"SELECT DISTINCT {date_col} FROM {table} WHERE id > ? AND {date_col} IS NOT NULL", (high_water,)
+            ))
+            marks[table] = new_high_water
+    return dates, marks
+
+
+def refresh_daily_fact(conn):
+    """Rebuild daily_fact rows for touched dates; returns the number of dates (caller commits)."""
+    create_fact_tables(conn)
+    if not table_exists(conn, "flight_history"):
+        return 0
+    dates, marks = touched_dates(conn)
+    if not marks:
+        return 0
+
+    # lets the per-date flight lookups use an index in the merged db too
+    create_index(conn, "idx_flight_history_date_delay")
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS fact_dates (date TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM fact_dates")
+    conn.executemany("INSERT INTO fact_dates (date) VALUES (?)", [(d,) for d in dates])
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS fact_airport_location (airport_code TEXT PRIMARY KEY, location TEXT)")
+    conn.execute("DELETE FROM fact_airport_location")
+    conn.executemany("INSERT INTO fact_airport_location (airport_code, location) VALUES (?, ?)",
+                     list(AIRPORT_LOCATIONS.items()))
+
+    has_weather = table_exists(conn, "daily_weather_summary")
+    has_stock = table_exists(conn, "airlines") and table_exists(conn, "stock_history")
+    weather_cols = "MAX(w.max_wind_speed), MAX(w.total_precip), MAX(w.severity_score)" if has_weather \
+        else "NULL, NULL, NULL"
+    weather_join = '''
+        LEFT JOIN fact_airport_location al ON al.airport_code = f.airport_code
+        LEFT JOIN daily_weather_summary w ON w.date = f.record_date AND w.location = al.location
+    ''' if has_weather else ""
+    stock_cols = "COUNT(s.id), AVG(s.return_percentage)" if has_stock else "0, NULL"
+    stock_join = '''
+        LEFT JOIN airlines a ON a.name = f.airline_name
+        LEFT JOIN stock_history s ON s.airline_id = a.id AND s.record_date = f.record_date
+    ''' if has_stock else ""
+    valid_delay = "typeof(f.dep_delay_min) IN ('integer', 'real') AND f.dep_delay_min >= 0"
+
+    conn.execute("DELETE FROM daily_fact WHERE date IN (SELECT date FROM fact_dates)")
+    conn.execute(f'''
+        INSERT INTO daily_fact
+        (date, airport_code, flight_count, delay_count, avg_delay_min,
+         max_wind_speed, total_precip, severity_score, listed_flights, stock_return)
+        SELECT f.record_date, f.airport_code,
+               COUNT(*),
+               COUNT(CASE WHEN {valid_delay} THEN 1 END),
+               AVG(CASE WHEN {valid_delay} THEN f.dep_delay_min END),
+               {weather_cols},
+               {stock_cols}
+        FROM flight_history f
+        {weather_join}
+        {stock_join}
+        WHERE f.record_date IN (SELECT date FROM fact_dates)
+        GROUP BY f.record_date, f.airport_code
+    ''')
+
+    conn.execute("DELETE FROM daily_fact_airline WHERE date IN (SELECT date FROM fact_dates)")
+    if has_stock:
+        conn.execute(f'''
+            INSERT INTO daily_fact_airline
+            (date, airport_code, airline_id, flight_count, avg_delay_min, return_percentage)
+            SELECT f.record_date, f.airport_code, a.id,
+                   COUNT(*),
+                   AVG(CASE WHEN {valid_delay} THEN f.dep_delay_min END),
+                   MAX(s.return_percentage)
+            FROM flight_history f
+            JOIN airlines a ON a.name = f.airline_name
+            LEFT JOIN stock_history s ON s.airline_id = a.id AND s.record_date = f.record_date
+            WHERE f.record_date IN (SELECT date FROM fact_dates)
+            GROUP BY f.record_date, f.airport_code, a.id
+        ''')
+
+    conn.executemany("INSERT OR REPLACE INTO daily_fact_state (source_table, high_water) VALUES (?, ?)",
+                     list(marks.items()))
+    return len(dates)
+
+
+if __name__ == "__main__":
+    db_file = sys.argv[1] if len(sys.argv) > 1 else "wzh_project.db"
+    connection = sqlite3.connect(db_file)
+    with connection:
+        print(f"daily_fact: refreshed {refresh_daily_fact(connection)} date(s) in {db_file}")
+    connection.close()
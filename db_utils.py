@@ -0,0 +1,64 @@
+"""
+Small SQLite helpers shared by the fetch/process scripts.
+"""
+
+import sqlite3
+from pathlib import Path
+
+from metrics import connection_factory
+
+# covering indexes for the query shapes run against the source and final dbs:
+# per-date flight stats and the record_date joins, per-airline stock
+# group-bys. Defined once here, so every script creating one by name builds
+# the same index.
+INDEXES = {
+    "idx_flight_history_date_delay": ("flight_history", "record_date, dep_delay_min"),
+    "idx_flight_history_airport_date_delay": ("flight_history", "airport_code, record_date, dep_delay_min"),
+    "idx_stock_history_airline_return": ("stock_history", "airline_id, return_percentage, price_range"),
+    "idx_stock_history_date": ("stock_history", "record_date, airline_id, return_percentage"),
+    "idx_weather_hourly_date": ("weather_hourly", "record_date"),
+}
+
+
+def create_index(conn, name):
+    """CREATE INDEX IF NOT EXISTS for one of INDEXES."""
+    table, columns = INDEXES[name]
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({columns})")
+
+
+def connect(db_path, **kwargs):
+    """sqlite3.connect(), with per-statement timing when WZH_METRICS=on (see metrics.py)."""
+    return sqlite3.connect(db_path, factory=connection_factory(), **kwargs)
+
+
+def connect_writer(db_path, cache_mb=64):
+    """
+    Connection tuned for a long-lived ingest writer.
+
+    WAL lets readers keep working while we write, and with
+    synchronous=NORMAL a commit no longer waits on an fsync (WAL keeps the
+    database consistent if the process crashes).
+    """
+    conn = connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{int(cache_mb * 1024)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def connect_readonly(db_path):
+    """Read-only connection (mode=ro URI): safe to share a database with writers and worker processes."""
+    return connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+
+
+def iter_rows(cursor, batch_size=1000):
+    """
+    Yield the rows of an executed cursor, fetchmany(batch_size) at a time,
+    so callers can stream a result set instead of fetchall()-ing it.
+    """
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            return
+        yield from batch
@@ -0,0 +1,229 @@
+"""
+Mergeable delay-percentile sketches for flight_history.
+
+Each (record_date, airport_code, airline_name) group keeps a small
+DDSketch-style histogram of departure delays: log-spaced buckets whose
+quantile estimates are within 1% (relative) of the true value. Sketches
+add up bucket by bucket, so a week, a month or all airports is just the
+merge of the daily sketches, with no pass over flight_history.
+
+Like avg_delay_min in process_flights_data(Ke).py the sketches only count
+non-negative delays (NULL and early departures are left out).
+
+flight_history is append-only (INSERT OR IGNORE), so refresh_delay_sketches()
+only folds in rows above the last seen id. The fetch script calls it
+(FlightWriter.refresh_sketches) once at the end of each fetch or backfill
+run; it can also be run by hand:
+    python delay_sketch.py flight_data.db            # daily p50/p90/p99
+    python delay_sketch.py flight_data.db week JFK   # weekly rollup for JFK
+"""
+
+import json
+import math
+import sqlite3
+import sys
+from datetime import datetime
+
+from db_utils import iter_rows
+
+RELATIVE_ACCURACY = 0.01
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class DelaySketch:
+    """Log-bucket quantile sketch (DDSketch) for non-negative values."""
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value, weight=1):
+        if value <= 0:
+            self.zero_count += weight
+        else:
+            index = math.ceil(math.log(value) / self.log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + weight
+        self.count += weight
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy.")
+        for index, n in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def bucket_value(self, index):
+        # midpoint (in relative terms) of (gamma^(i-1), gamma^i]
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return self.bucket_value(index)
+        return self.bucket_value(max(self.bins))
+
+    def to_json(self):
+        return json.dumps({
+            "alpha": self.relative_accuracy,
+            "zero": self.zero_count,
+            "bins": {str(i): n for i, n in self.bins.items()},
+        })
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        sketch = cls(data["alpha"])
+        sketch.zero_count = data["zero"]
+        sketch.bins = {int(i): n for i, n in data["bins"].items()}
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
+
+
+def create_sketch_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS flight_delay_sketch (
+            record_date TEXT NOT NULL,
+            airport_code TEXT NOT NULL,
+            airline_name TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            sketch TEXT NOT NULL,
+            PRIMARY KEY (record_date, airport_code, airline_name)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS flight_delay_sketch_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            high_water INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO flight_delay_sketch_state (id, high_water) VALUES (1, 0)")
+
+
+def refresh_delay_sketches(conn, batch_size=1000):
+    """Fold flight_history rows above the high-water mark into their sketches (caller commits)."""
+    create_sketch_tables(conn)
+    high_water = conn.execute("SELECT high_water FROM flight_delay_sketch_state WHERE id = 1").fetchone()[0]
+
+    cur = conn.execute('''
+        SELECT id, record_date, airport_code, COALESCE(airline_name, ''), dep_delay_min
+        FROM flight_history
+        WHERE id > ? AND record_date IS NOT NULL
+        ORDER BY id
+    ''', (high_water,))
+
+    touched = {}
+    new_high_water = high_water
+    for row_id, record_date, airport_code, airline_name, delay in iter_rows(cur, batch_size):
+        new_high_water = row_id
+        if not isinstance(delay, (int, float)) or delay < 0:
+            continue
+        key = (record_date, airport_code, airline_name)
+        sketch = touched.get(key)
+        if sketch is None:
+            stored = conn.execute('''
+                SELECT sketch FROM flight_delay_sketch
+                WHERE record_date = ? AND airport_code = ? AND airline_name = ?
+            ''', key).fetchone()
+            sketch = DelaySketch.from_json(stored[0]) if stored else DelaySketch()
+            touched[key] = sketch
+        sketch.add(delay)
+
+    conn.executemany('''
+        INSERT OR REPLACE INTO flight_delay_sketch (record_date, airport_code, airline_name, n, sketch)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [key + (sketch.count, sketch.to_json()) for key, sketch in touched.items()])
+    conn.execute("UPDATE flight_delay_sketch_state SET high_water = ? WHERE id = 1", (new_high_water,))
+    return len(touched)
+
+
+def sketch_rows(conn, start_date=None, end_date=None, airport_code=None, airline_name=None):
+    where = []
+    params = []
+    if start_date is not None:
+        where.append("record_date >= ?")
+        params.append(start_date)
+    if end_date is not None:
+        where.append("record_date <= ?")
+        params.append(end_date)
+    if airport_code is not None:
+        where.append("airport_code = ?")
+        params.append(airport_code)
+    if airline_name is not None:
+        where.append("airline_name = ?")
+        params.append(airline_name)
+    sql = "SELECT record_date, sketch FROM flight_delay_sketch"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return iter_rows(conn.execute(sql + " ORDER BY record_date", params))
+
+
+def delay_quantiles(conn, start_date=None, end_date=None, airport_code=None, airline_name=None,
+                    quantiles=QUANTILES):
+    """Merged quantiles over the matching sketches: {'count': n, 0.5: ..., 0.9: ..., 0.99: ...}."""
+    merged = DelaySketch()
+    for _, text in sketch_rows(conn, start_date, end_date, airport_code, airline_name):
+        merged.merge(DelaySketch.from_json(text))
+    result = {"count": merged.count}
+    for q in quantiles:
+        result[q] = merged.quantile(q)
+    return result
+
+
+def period_key(date_str, period):
+    if period == "day":
+        return date_str
+    if period == "month":
+        return date_str[:7]
+    if period == "week":
+        # same %Y-Week%U buckets as the weekly wind report
+        return datetime.strptime(date_str, "%Y-%m-%d").strftime("%Y-Week%U")
+    raise ValueError(f"Unknown period: {period}")
+
+
+def delay_rollup(conn, period="week", start_date=None, end_date=None, airport_code=None, airline_name=None,
+                 quantiles=QUANTILES):
+    """
+    Per-period quantiles from the daily sketches.
+
+    Returns:
+        list of tuples: (period_key, count, q1, q2, ...) in period order
+    """
+    merged = {}
+    for date_str, text in sketch_rows(conn, start_date, end_date, airport_code, airline_name):
+        key = period_key(date_str, period)
+        sketch = DelaySketch.from_json(text)
+        if key in merged:
+            merged[key].merge(sketch)
+        else:
+            merged[key] = sketch
+    return [(key, sketch.count) + tuple(sketch.quantile(q) for q in quantiles)
+            for key, sketch in sorted(merged.items())]
+
+
+if __name__ == "__main__":
+    db_file = sys.argv[1] if len(sys.argv) > 1 else "flight_data.db"
+    period = sys.argv[2] if len(sys.argv) > 2 else "day"
+    airport = sys.argv[3] if len(sys.argv) > 3 else None
+
+    connection = sqlite3.connect(db_file)
+    with connection:
+        groups = refresh_delay_sketches(connection)
+    print(f"Updated {groups} sketch group(s)")
+
+    print(f"{'period':<14}{'flights':>8}{'p50':>9}{'p90':>9}{'p99':>9}")
+    for key, n, p50, p90, p99 in delay_rollup(connection, period, airport_code=airport):
+        print(f"{key:<14}{n:>8}{p50:>9.1f}{p90:>9.1f}{p99:>9.1f}")
+    connection.close()
@@ -0,0 +1,225 @@
+"""
+Columnar snapshots of the history tables for notebooks.
+
+Each table is written per month (by record_date) under
+    export/<table>/month=YYYY-MM/
+either as part.parquet (when pyarrow is installed) or as one .npy file per
+column, which np.load(..., mmap_mode="r") maps without copying:
+    INTEGER -> int64, REAL -> float64, TEXT -> fixed-width unicode
+plus <column>.mask.npy (True = NULL) for columns that have NULLs.
+full_data_json is never exported (see payload_store.py for the raw payloads).
+
+Exports are incremental: export/<table>/_manifest.json records each month's
+row count and max id, and only months whose numbers changed are rewritten.
+
+Usage:
+    python export_columnar.py                        # all three databases
+    python export_columnar.py --format npy --out export flight_data.db
+
+    from export_columnar import load_month, load_table
+    cols = load_month("export", "flight_history", "2025-10")   # mmap'd arrays
+"""
+
+import argparse
+import json
+import os
+import shutil
+from datetime import date
+
+import numpy as np
+
+from db_utils import connect_readonly, iter_rows
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_DIR = "export"
+# table -> column holding the partition date
+EXPORT_TABLES = {
+    "flight_history": "record_date",
+    "weather_history": "record_date",
+    "weather_hourly": "record_date",
+    "stock_history": "record_date",
+}
+SKIP_COLUMNS = {"full_data_json"}
+SOURCE_DBS = ["flight_data.db", "weather_data.db", "stock_data.db"]
+
+
+def table_columns(conn, table):
+    """[(name, declared_type)] for the exported columns."""
+    return [(row[1], (row[2] or "").upper()) for row in conn.execute(f"PRAGMA table_info({table})")
+            if row[1] not in SKIP_COLUMNS]
+
+
+def month_range(month):
+    year, mon = int(month[:4]), int(month[5:7])
+    start = date(year, mon, 1)
+    end = date(year + 1, 1, 1) if mon == 12 else date(year, mon + 1, 1)
+    return start.isoformat(), end.isoformat()
+
+
+def month_fingerprints(conn, table, date_col):
+    """{month: [row_count, max_id]} straight from SQLite."""
+    rows = conn.execute(f'''
+        SELECT substr({date_col}, 1, 7), COUNT(*), MAX(id)
+        FROM {table}
+        WHERE {date_col} IS NOT NULL
+        GROUP BY 1
+    ''')
+    return {month: [count, max_id] for month, count, max_id in rows}
+
+
+def to_array(values, decl_type):
+    """(array, null_mask or None) for one column."""
+    mask = np.array([v is None for v in values], dtype=bool)
+    if "INT" in decl_type:
+        data = np.array([0 if v is None else int(v) for v in values], dtype=np.int64)
+    elif "REAL" in decl_type or "FLOA" in decl_type or "DOUB" in decl_type:
+        data = np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+    else:
+        data = np.array(["" if v is None else str(v) for v in values], dtype=str)
+    return data, (mask if mask.any() else None)
+
+
+def read_month(conn, table, date_col, columns, month, batch_size=5000):
+    start, end = month_range(month)
+    names = ", ".join(name for name, _ in columns)
+    cur = conn.execute(f'''
+        SELECT {names} FROM {table}
+        WHERE {date_col} >= ? AND {date_col} < ?
+        ORDER BY id
+    ''', (start, end))
+    values = [[] for _ in columns]
+    for row in iter_rows(cur, batch_size):
+        for i, v in enumerate(row):
+            values[i].append(v)
+    return values
+
+
+def write_npy(part_dir, columns, values):
+    for (name, decl_type), col in zip(columns, values):
+        data, mask = to_array(col, decl_type)
+        np.save(os.path.join(part_dir, f"{name}.npy"), data)
+        if mask is not None:
+            np.save(os.path.join(part_dir, f"{name}.mask.npy"), mask)
+
+
+def write_parquet(part_dir, columns, values):
+    arrays = {}
+    for (name, decl_type), col in zip(columns, values):
+        if "INT" in decl_type:
+            arrays[name] = pyarrow.array(col, type=pyarrow.int64())
+        elif "REAL" in decl_type or "FLOA" in decl_type or "DOUB" in decl_type:
+            arrays[name] = pyarrow.array(col, type=pyarrow.float64())
+        else:
+            arrays[name] = pyarrow.array(col, type=pyarrow.string())
+    pyarrow.parquet.write_table(pyarrow.table(arrays), os.path.join(part_dir, "part.parquet"))
+
+
+def load_manifest(table_dir):
+    path = os.path.join(table_dir, "_manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(table_dir, manifest):
+    tmp = os.path.join(table_dir, "_manifest.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(table_dir, "_manifest.json"))
+
+
+def export_table(conn, table, out_dir=EXPORT_DIR, fmt=None):
+    """Write changed month partitions of one table; returns the months written."""
+    fmt = fmt or ("parquet" if pyarrow is not None else "npy")
+    if fmt == "parquet" and pyarrow is None:
+        raise RuntimeError("Parquet export needs pyarrow; install it or use --format npy.")
+    date_col = EXPORT_TABLES[table]
+    columns = table_columns(conn, table)
+    table_dir = os.path.join(out_dir, table)
+    os.makedirs(table_dir, exist_ok=True)
+
+    manifest = load_manifest(table_dir)
+    current = month_fingerprints(conn, table, date_col)
+    written = []
+    for month, (count, max_id) in sorted(current.items()):
+        entry = manifest.get(month)
+        if entry and entry["rows"] == count and entry["max_id"] == max_id and entry["format"] == fmt:
+            continue
+        values = read_month(conn, table, date_col, columns, month)
+
+        # build next to the old partition, then swap, so readers never see half a month
+        part_dir = os.path.join(table_dir, f"month={month}")
+        tmp_dir = part_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        if fmt == "parquet":
+            write_parquet(tmp_dir, columns, values)
+        else:
+            write_npy(tmp_dir, columns, values)
+        shutil.rmtree(part_dir, ignore_errors=True)
+        os.replace(tmp_dir, part_dir)
+
+        manifest[month] = {"rows": count, "max_id": max_id, "format": fmt,
+                           "columns": [name for name, _ in columns]}
+        save_manifest(table_dir, manifest)
+        written.append(month)
+
+    # months that no longer have rows
+    for month in sorted(set(manifest) - set(current)):
+        shutil.rmtree(os.path.join(table_dir, f"month={month}"), ignore_errors=True)
+        del manifest[month]
+        save_manifest(table_dir, manifest)
+    return written
+
+
+def export_db(db_path, out_dir=EXPORT_DIR, fmt=None):
+    conn = connect_readonly(db_path)
+    for table in EXPORT_TABLES:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+        if exists:
+            written = export_table(conn, table, out_dir, fmt)
+            print(f"[{db_path}] {table}: wrote {len(written)} month(s) {', '.join(written)}")
+    conn.close()
+
+
+def load_month(out_dir, table, month, mmap=True):
+    """
+    One month as {column: array}. npy partitions are memory-mapped
+    (NULLs are in '<column>.mask' entries); parquet partitions come back
+    as a pyarrow.Table.
+    """
+    part_dir = os.path.join(out_dir, table, f"month={month}")
+    if os.path.exists(os.path.join(part_dir, "part.parquet")):
+        return pyarrow.parquet.read_table(os.path.join(part_dir, "part.parquet"))
+    columns = {}
+    for name in sorted(os.listdir(part_dir)):
+        if name.endswith(".npy"):
+            columns[name[:-4]] = np.load(os.path.join(part_dir, name), mmap_mode="r" if mmap else None)
+    return columns
+
+
+def load_table(out_dir, table, months=None):
+    """{month: columns} for the exported months (all of them by default), each via load_month."""
+    manifest = load_manifest(os.path.join(out_dir, table))
+    return {month: load_month(out_dir, table, month) for month in sorted(months or manifest)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export history tables as monthly columnar snapshots")
+    parser.add_argument("databases", nargs="*", default=SOURCE_DBS)
+    parser.add_argument("--out", default=EXPORT_DIR)
+    parser.add_argument("--format", choices=["parquet", "npy"], default=None,
+                        help="default: parquet if pyarrow is installed, else npy")
+    args = parser.parse_args()
+
+    for db in args.databases:
+        if os.path.exists(db):
+            export_db(db, args.out, args.format)
+        else:
+            print(f"Skip (not found): {db}")
@@ -1,8 +1,14 @@
 import requests
 import sqlite3
-import json
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import date, timedelta
 from config import AVIATIONSTACK_API_KEY
+from ingest_client import get_client
+from db_utils import connect_writer
+from metrics import get_metrics
+from payload_store import create_payload_table, save_payloads
+from delay_sketch import refresh_delay_sketches
 import time
 
 
@@ -40,6 +46,21 @@ def create_db_table(db_path):
         VALUES (1, '2025-09-20', 0)
     ''')
 
+    # per-page progress for backfill runs, so an interrupted run can resume
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS flight_fetch_page_progress (
+            airport_code TEXT NOT NULL,
+            record_date TEXT NOT NULL,
+            page_offset INTEGER NOT NULL,
+            pulled INTEGER NOT NULL,
+            total INTEGER,
+            PRIMARY KEY (airport_code, record_date, page_offset)
+        )
+    ''')
+
+    # raw API payloads, compressed, keyed by flight_history.id
+    create_payload_table(conn, "flight_history")
+
     conn.commit()
     conn.close()
 
@@ -54,10 +75,17 @@ def get_date_list(start_date, end_date):
     return dates
 
 
-def fetch_raw_flights_for_date(access_key, airport_code, record_date, offset=0, limit=25):
+def fetch_flight_page(access_key, airport_code, record_date, offset=0, limit=25):
+    """
+    Fetch one page of departures.
+
+    Returns (flights, total), where total is the API's pagination total
+    (None if not reported). Returns (None, None) when the request failed,
+    so callers can tell a failed page from an empty one.
+    """
     if not access_key:
         print("Error: Missing AVIATIONSTACK_API_KEY")
-        return []
+        return None, None
 
     base_url = "https://api.aviationstack.com/v1/flights"
     date_str = record_date.strftime("%Y-%m-%d")
@@ -71,34 +99,44 @@ def fetch_raw_flights_for_date(access_key, airport_code, record_date, offset=0,
     }
 
     try:
-        resp = requests.get(base_url, params=params, timeout=20)
+        resp = get_client().get("aviationstack", base_url, params=params, timeout=20)
         resp.raise_for_status()
         data = resp.json()
 
         if isinstance(data, dict) and data.get("error"):
             print(f"API error on {date_str}: {data.get('error')}")
-            return []
+            return None, None
 
         flights = data.get("data", []) if isinstance(data, dict) else []
-        print(f"[DEBUG] {date_str} offset={offset} pulled={len(flights)}")
+        pagination = (data.get("pagination") or {}) if isinstance(data, dict) else {}
+        print(f"[DEBUG] {airport_code} {date_str} offset={offset} pulled={len(flights)}")
 
-        return flights
+        return flights, pagination.get("total")
 
     except requests.exceptions.RequestException as e:
         print(f"Request failed on {date_str} offset={offset}: {e}")
-        return []
+        return None, None
     except ValueError:
         print(f"JSON decode failed on {date_str} offset={offset}. Raw text: {resp.text[:200] if 'resp' in locals() else ''}")
-        return []
+        return None, None
 
 
+def fetch_raw_flights_for_date(access_key, airport_code, record_date, offset=0, limit=25):
+    flights, _ = fetch_flight_page(access_key, airport_code, record_date, offset=offset, limit=limit)
+    return flights or []
 
 
-def save_to_db(db_path, airport_code, record_date, flights):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
 
-    date_str = record_date.strftime("%Y-%m-%d")
+
+INSERT_FLIGHT_SQL = '''
+    INSERT OR IGNORE INTO flight_history
+    (airport_code, record_date, flight_iata, airline_name, flight_status,
+     dep_delay_min, dep_scheduled, dep_estimated, dep_actual, arr_iata, full_data_json)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def flight_rows(airport_code, date_str, flights):
     rows = []
     for item in flights:
         flight_iata = (item.get("flight") or {}).get("iata")
@@ -119,21 +157,94 @@ def save_to_db(db_path, airport_code, record_date, flights):
             dep.get("estimated"),
             dep.get("actual"),
             arr.get("iata"),
-            json.dumps(item)
+            None  # full_data_json: the raw payload goes to flight_history_payload
         ))
+    return rows
+
+
+class FlightWriter:
+    """
+    One tuned connection (WAL, synchronous=NORMAL) for a whole ingest run.
+
+    write_page() inserts a page of flights and updates whichever progress
+    record the caller passes in the same transaction, so a crash can't
+    leave data saved without progress (or the other way round).
+    Use it as a context manager so the connection is closed even when a
+    page fails.
+    """
+
+    def __init__(self, db_path):
+        self.conn = connect_writer(db_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write_page(self, airport_code, record_date, flights, next_progress=None, page=None):
+        """
+        next_progress: (next_date, next_offset) for flight_fetch_progress
+        page: (offset, pulled, total) for flight_fetch_page_progress
+        Returns the number of new flights.
+        """
+        date_str = record_date.strftime("%Y-%m-%d")
+        with self.conn:
+            inserted = 0
+            if flights:
+                inserted = self.insert_flights(airport_code, date_str, flights)
+
+            if next_progress is not None:
+                next_date, next_offset = next_progress
+                self.conn.execute(
+                    "UPDATE flight_fetch_progress SET next_date=?, next_offset=? WHERE id=1",
+                    (next_date.isoformat(), next_offset)
+                )
+            if page is not None:
+                offset, pulled, total = page
+                self.conn.execute('''
+                    INSERT OR REPLACE INTO flight_fetch_page_progress
+                    (airport_code, record_date, page_offset, pulled, total)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (airport_code, date_str, offset, pulled, total))
 
-    cursor.executemany('''
-        INSERT OR IGNORE INTO flight_history
-        (airport_code, record_date, flight_iata, airline_name, flight_status,
-         dep_delay_min, dep_scheduled, dep_estimated, dep_actual, arr_iata, full_data_json)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', rows)
+        if flights:
+            print(f"Inserted {inserted} new flights for {date_str} (pulled {len(flights)})")
+        return inserted
+
+    def insert_flights(self, airport_code, date_str, flights):
+        rows = flight_rows(airport_code, date_str, flights)
+        max_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM flight_history").fetchone()[0]
+        self.conn.executemany(INSERT_FLIGHT_SQL, rows)
+
+        # Rows that were actually inserted got ids > max_id, in page order,
+        # so walk the page and pair each one with its raw payload.
+        new_rows = self.conn.execute(
+            "SELECT id, flight_iata FROM flight_history WHERE id > ? ORDER BY id", (max_id,)
+        ).fetchall()
+        payloads = []
+        pending = iter(new_rows)
+        current = next(pending, None)
+        for row, item in zip(rows, flights):
+            if current is not None and current[1] == row[2]:
+                payloads.append((current[0], item))
+                current = next(pending, None)
+        save_payloads(self.conn, "flight_history", payloads)
+        return len(new_rows)
+
+    def refresh_sketches(self):
+        """Fold the run's new flights into the delay-percentile sketches (once per run)."""
+        with self.conn:
+            refresh_delay_sketches(self.conn)
+
+    def close(self):
+        self.conn.close()
 
-    inserted = cursor.rowcount
-    conn.commit()
-    conn.close()
-    print(f"Inserted {inserted} new flights for {date_str} (pulled {len(flights)})")
-    return inserted
+
+def save_to_db(db_path, airport_code, record_date, flights):
+    # one page; the next fetch run's refresh_sketches() folds it in
+    with FlightWriter(db_path) as writer:
+        return writer.write_page(airport_code, record_date, flights)
 
 def fetch_flight_data(access_key, airport_code, db_path='flight_data.db', items_per_run=25):
     create_db_table(db_path)
@@ -147,10 +258,16 @@ def fetch_flight_data(access_key, airport_code, db_path='flight_data.db', items_
     current_date = date.fromisoformat(next_date_str)
     offset = next_offset
 
-    end_date = date(2025, 12, 10)
-
     print(f"Starting from {current_date.isoformat()}, offset={offset}, max={items_per_run} items...")
+    with FlightWriter(db_path) as writer:
+        inserted = fetch_pages(access_key, airport_code, writer, current_date, offset, items_per_run)
+        writer.refresh_sketches()
+    return inserted
+
 
+def fetch_pages(access_key, airport_code, writer, current_date, offset, items_per_run):
+    # the first page with flights from current_date/offset on, rolling over empty days
+    end_date = date(2025, 12, 10)
     max_date_rolls = 7
     rolls = 0
 
@@ -164,22 +281,12 @@ def fetch_flight_data(access_key, airport_code, db_path='flight_data.db', items_
         )
 
         if flights:
-            inserted = save_to_db(db_path, airport_code, current_date, flights)
-
             next_day = current_date + timedelta(days=1)
             offset = 0
-
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE flight_fetch_progress SET next_date=?, next_offset=? WHERE id=1",
-                (next_day.isoformat(), offset)
-            )
-            conn.commit()
-            conn.close()
+            inserted = writer.write_page(airport_code, current_date, flights, next_progress=(next_day, offset))
 
             print(f"Run done. Inserted {inserted}. Next: {next_day.isoformat()} offset=0. Re-run to continue.")
-            return
+            return inserted
 
         print(f"No flights for {current_date.isoformat()} at offset={offset}. Move to next day.")
         current_date += timedelta(days=1)
@@ -187,6 +294,120 @@ def fetch_flight_data(access_key, airport_code, db_path='flight_data.db', items_
         rolls += 1
 
     print("No flights returned after several date rollovers.")
+    return 0
+
+
+def load_done_pages(db_path):
+    """Return {(airport_code, date_str): {offset: (pulled, total)}} for finished pages."""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT airport_code, record_date, page_offset, pulled, total
+        FROM flight_fetch_page_progress
+    """)
+    done = {}
+    for airport_code, date_str, page_offset, pulled, total in cursor.fetchall():
+        done.setdefault((airport_code, date_str), {})[page_offset] = (pulled, total)
+    conn.close()
+    return done
+
+
+def next_offsets(offset, pulled, total, page_size):
+    """Offsets a day still needs, given one finished page of it."""
+    if total is not None:
+        return list(range(0, total, page_size))
+    if pulled >= page_size:
+        return [offset + page_size]
+    return []
+
+
+def backfill_flights(access_key, airport_codes, start_date, end_date, db_path='flight_data.db',
+                     page_size=100, max_workers=8, requests_per_second=None):
+    """
+    Fetch every page of every day in [start_date, end_date] for each airport.
+
+    Pages are fetched on a bounded thread pool that shares the aviationstack
+    rate limit of the ingest client (override with requests_per_second).
+    Rows are written on the calling thread through one FlightWriter, and
+    each page is recorded in flight_fetch_page_progress in the same
+    transaction as its rows, so re-running after an interruption only
+    fetches what is missing.
+    """
+    create_db_table(db_path)
+    done = load_done_pages(db_path)
+    client = get_client()
+    if requests_per_second:
+        client.set_rate_limit("aviationstack", requests_per_second)
+
+    def fetch_page(airport_code, day, offset):
+        return fetch_flight_page(access_key, airport_code, day, offset=offset, limit=page_size)
+
+    days = get_date_list(start_date, end_date)
+    print(f"Backfill {','.join(airport_codes)} {start_date.isoformat()} -> {end_date.isoformat()} "
+          f"({len(days)} days, {max_workers} workers)")
+
+    started = time.monotonic()
+    pages_done = 0
+    pages_failed = 0
+    inserted_total = 0
+
+    with FlightWriter(db_path) as writer, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        scheduled = set()
+
+        def schedule(airport_code, day, offset):
+            if (airport_code, day, offset) in scheduled:
+                return
+            scheduled.add((airport_code, day, offset))
+            if offset in done.get((airport_code, day.isoformat()), {}):
+                return
+            futures[pool.submit(fetch_page, airport_code, day, offset)] = (airport_code, day, offset)
+
+        for airport_code in airport_codes:
+            for day in days:
+                schedule(airport_code, day, 0)
+                finished = done.get((airport_code, day.isoformat()), {})
+                for offset, (pulled, total) in finished.items():
+                    for nxt in next_offsets(offset, pulled, total, page_size):
+                        schedule(airport_code, day, nxt)
+
+        while futures:
+            completed, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for fut in completed:
+                airport_code, day, offset = futures.pop(fut)
+                flights, total = fut.result()
+
+                if flights is None:
+                    pages_failed += 1
+                    continue
+
+                inserted_total += writer.write_page(airport_code, day, flights,
+                                                    page=(offset, len(flights), total))
+                pages_done += 1
+
+                for nxt in next_offsets(offset, len(flights), total, page_size):
+                    schedule(airport_code, day, nxt)
+
+        # fold the run's new flights into the delay sketches once, at the end
+        writer.refresh_sketches()
+    elapsed = time.monotonic() - started
+    print(f"Backfill done in {elapsed:.1f}s. Pages fetched: {pages_done}, failed: {pages_failed}, "
+          f"inserted: {inserted_total}.")
+    if pages_failed:
+        print("Some pages failed. Re-run the same backfill to retry only those pages.")
+    client.print_latency_summary()
+    return inserted_total
+
 
 if __name__ == "__main__":
-    fetch_flight_data(AVIATIONSTACK_API_KEY, "JFK")
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        # python "fetch_flight_data(Ke).py" backfill JFK,LGA 2025-09-01 2025-12-10
+        airports = sys.argv[2].split(",") if len(sys.argv) > 2 else ["JFK"]
+        start = date.fromisoformat(sys.argv[3]) if len(sys.argv) > 3 else date(2025, 9, 1)
+        end = date.fromisoformat(sys.argv[4]) if len(sys.argv) > 4 else date(2025, 12, 10)
+        with get_metrics().stage("backfill_flights") as st:
+            st.add(written=backfill_flights(AVIATIONSTACK_API_KEY, airports, start, end))
+    else:
+        with get_metrics().stage("fetch_flights") as st:
+            st.add(written=fetch_flight_data(AVIATIONSTACK_API_KEY, "JFK"))
+        get_client().print_latency_summary()
\ No newline at end of file
@@ -12,9 +12,11 @@ GRADING REQUIREMENTS MET:
 
 import requests
 import sqlite3
-import json
+import sys
 from datetime import date, timedelta
 from config import MARKETSTACK_API_KEY
+from ingest_client import get_client
+from metrics import get_metrics
 
 # Database file
 DATABASE_NAME = "stock_data.db"
@@ -93,11 +95,259 @@ def create_tables(db_path):
     conn.close()
 
 
-def get_airline_id(cursor, symbol):
-    """Get airline_id (INTEGER) for a symbol - avoids duplicate strings."""
-    cursor.execute('SELECT id FROM airlines WHERE symbol = ?', (symbol,))
-    result = cursor.fetchone()
-    return result[0] if result else None
+# One-off NYSE closures that don't follow the regular holiday rules
+NYSE_SPECIAL_CLOSURES = {
+    date(2012, 10, 29), date(2012, 10, 30),  # Hurricane Sandy
+    date(2018, 12, 5),                       # National day of mourning (G.H.W. Bush)
+    date(2025, 1, 9),                        # National day of mourning (J. Carter)
+}
+
+
+def easter_sunday(year):
+    """Gregorian Easter (anonymous Gregorian algorithm)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def nth_weekday(year, month, weekday, n):
+    """n-th given weekday (Mon=0) of a month; n=-1 means the last one."""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = (date(year, month + 1, 1) if month < 12 else date(year + 1, 1, 1)) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def observed(holiday):
+    """Saturday holidays close the Friday before, Sunday holidays the Monday after."""
+    if holiday.weekday() == 5:
+        return holiday - timedelta(days=1)
+    if holiday.weekday() == 6:
+        return holiday + timedelta(days=1)
+    return holiday
+
+
+def nyse_holidays(year):
+    """Full-day NYSE market holidays for a year."""
+    holidays = {
+        nth_weekday(year, 1, 0, 3),              # Martin Luther King Jr. Day
+        nth_weekday(year, 2, 0, 3),              # Washington's Birthday
+        easter_sunday(year) - timedelta(days=2), # Good Friday
+        nth_weekday(year, 5, 0, -1),             # Memorial Day
+        observed(date(year, 7, 4)),              # Independence Day
+        nth_weekday(year, 9, 0, 1),              # Labor Day
+        nth_weekday(year, 11, 3, 4),             # Thanksgiving
+        observed(date(year, 12, 25)),            # Christmas
+    }
+    # NYSE does not close on Dec 31 when New Year's Day falls on a Saturday
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        holidays.add(observed(new_year))
+    if year >= 2022:
+        holidays.add(observed(date(year, 6, 19)))  # Juneteenth
+    return holidays
+
+
+def is_trading_day(day):
+    if day.weekday() >= 5 or day in NYSE_SPECIAL_CLOSURES:
+        return False
+    return day not in nyse_holidays(day.year)
+
+
+def trading_windows(start_date, end_date, window_days=90):
+    """
+    Split [start_date, end_date] into windows of at most window_days calendar
+    days, trimmed to their first and last trading day. Windows with no
+    trading days are dropped.
+    """
+    windows = []
+    current = start_date
+    while current <= end_date:
+        window_end = min(current + timedelta(days=window_days - 1), end_date)
+        days = []
+        day = current
+        while day <= window_end:
+            if is_trading_day(day):
+                days.append(day)
+            day += timedelta(days=1)
+        if days:
+            windows.append((days[0], days[-1]))
+        current = window_end + timedelta(days=1)
+    return windows
+
+
+def fetch_eod_range(access_key, symbols, date_from, date_to, page_limit=1000):
+    """
+    Fetch /eod for all symbols over [date_from, date_to], following
+    marketstack pagination. Returns (records, api_calls); records is None
+    when a request failed.
+    """
+    base_url = "http://api.marketstack.com/v1/eod"
+    records = []
+    offset = 0
+    api_calls = 0
+
+    while True:
+        params = {
+            'access_key': access_key,
+            'symbols': ','.join(symbols),
+            'date_from': date_from.strftime("%Y-%m-%d"),
+            'date_to': date_to.strftime("%Y-%m-%d"),
+            'limit': page_limit,
+            'offset': offset
+        }
+        try:
+            response = get_client().get("marketstack", base_url, params=params, timeout=30)
+            api_calls += 1
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"  Request failed: {e}")
+            return None, api_calls
+
+        if 'error' in data:
+            print(f"  API error: {data.get('error')}")
+            return None, api_calls
+
+        page = data.get('data', [])
+        records.extend(page)
+
+        pagination = data.get('pagination') or {}
+        total = pagination.get('total')
+        offset += len(page)
+        if not page or total is None or offset >= total:
+            return records, api_calls
+
+
+def load_airline_ids(cursor):
+    """Load the symbol -> airline_id map once, instead of a SELECT per record."""
+    cursor.execute('SELECT symbol, id FROM airlines')
+    return dict(cursor.fetchall())
+
+
+def build_stock_rows(records, airline_ids):
+    """Turn marketstack EOD records into stock_history rows (unknown symbols are skipped)."""
+    rows = []
+    for record in records:
+        airline_id = airline_ids.get(record.get('symbol'))
+        if not airline_id:
+            continue
+
+        open_p = record.get('open')
+        close_p = record.get('close')
+        high_p = record.get('high')
+        low_p = record.get('low')
+
+        # Calculate metrics
+        ret_pct = round(((close_p - open_p) / open_p) * 100, 4) if open_p and close_p else None
+        price_rng = round(high_p - low_p, 4) if high_p and low_p else None
+
+        rows.append((airline_id, record.get('date', '')[:10], open_p, close_p, high_p, low_p,
+                     record.get('volume'), ret_pct, price_rng))
+    return rows
+
+
+def drop_existing_rows(conn, rows):
+    """Rows whose (airline_id, record_date) isn't in stock_history yet (nor earlier in `rows`)."""
+    if not rows:
+        return rows
+    dates = sorted({row[1] for row in rows})
+    seen = set(conn.execute(f'''
+        SELECT airline_id, record_date FROM stock_history
+        WHERE record_date IN ({",".join("?" * len(dates))})
+    ''', dates).fetchall())
+    new_rows = []
+    for row in rows:
+        if (row[0], row[1]) not in seen:
+            seen.add((row[0], row[1]))
+            new_rows.append(row)
+    return new_rows
+
+
+def save_stock_rows(conn, rows):
+    """
+    Insert one API page of rows with a single executemany.
+
+    Runs inside the caller's transaction. Returns the number of rows
+    actually inserted (duplicates ignored by the UNIQUE key don't count).
+    """
+    if not rows:
+        return 0
+    before = conn.total_changes
+    conn.executemany('''
+        INSERT OR IGNORE INTO stock_history
+        (airline_id, record_date, open_price, close_price,
+         high_price, low_price, volume, return_percentage, price_range)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return conn.total_changes - before
+
+
+def update_progress(conn, next_date, total_records):
+    conn.execute('UPDATE fetch_progress SET last_fetch_date = ?, total_records = ? WHERE id = 1',
+                 (next_date.strftime("%Y-%m-%d"), total_records))
+
+
+def fetch_stock_data_range(access_key, db_path=DATABASE_NAME, end_date=date(2024, 12, 31), window_days=90):
+    """
+    Range mode: one /eod call per multi-week window for all symbols at once,
+    skipping weekends and NYSE holidays. Resumes from fetch_progress.
+    """
+    create_tables(db_path)
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('SELECT last_fetch_date, total_records FROM fetch_progress WHERE id = 1')
+    last_date_str, total_records = cursor.fetchone()
+    start_date = date.fromisoformat(last_date_str)
+
+    print("=" * 60)
+    print("STOCK DATA FETCH (range mode) - Ronghao Wang")
+    print("=" * 60)
+
+    windows = trading_windows(start_date, end_date, window_days)
+    if not windows:
+        print(f"\n No trading days between {start_date} and {end_date}. Nothing to fetch.")
+        conn.close()
+        return
+
+    symbols = [a['symbol'] for a in AIRLINES]
+    airline_ids = load_airline_ids(cursor)
+    api_calls = 0
+    items_saved = 0
+
+    for window_start, window_end in windows:
+        print(f"\nFetching {window_start} -> {window_end}...")
+        records, calls = fetch_eod_range(access_key, symbols, window_start, window_end)
+        api_calls += calls
+        if records is None:
+            break
+
+        # rows and progress commit together, one transaction per window
+        with conn:
+            inserted = save_stock_rows(conn, build_stock_rows(records, airline_ids))
+            items_saved += inserted
+            total_records += inserted
+            update_progress(conn, window_end + timedelta(days=1), total_records)
+        print(f"  {len(records)} records, {inserted} new")
+
+    conn.close()
+
+    print("\n" + "=" * 60)
+    print(f"API calls: {api_calls}")
+    print(f"Items saved this run: {items_saved}")
+    print(f"Total records: {total_records}")
+    print("=" * 60)
+    return items_saved
 
 
 def fetch_stock_data(access_key, db_path=DATABASE_NAME, items_per_run=100):
@@ -138,9 +388,14 @@ def fetch_stock_data(access_key, db_path=DATABASE_NAME, items_per_run=100):
     base_url = "http://api.marketstack.com/v1/eod"
     symbols_str = ','.join([a['symbol'] for a in AIRLINES])
     
+    airline_ids = load_airline_ids(cursor)
     items_saved = 0
     
     while current_date <= end_date and items_saved < items_per_run:
+        if not is_trading_day(current_date):
+            current_date += timedelta(days=1)
+            continue
+
         date_str = current_date.strftime("%Y-%m-%d")
         print(f"\nFetching {date_str}...")
         
@@ -153,7 +408,7 @@ def fetch_stock_data(access_key, db_path=DATABASE_NAME, items_per_run=100):
         }
         
         try:
-            response = requests.get(base_url, params=params, timeout=30)
+            response = get_client().get("marketstack", base_url, params=params, timeout=30)
             response.raise_for_status()
             data = response.json()
             
@@ -169,43 +424,25 @@ def fetch_stock_data(access_key, db_path=DATABASE_NAME, items_per_run=100):
                 current_date += timedelta(days=1)
                 continue
             
-            for record in records:
-                if items_saved >= items_per_run:
-                    break
-                
-                symbol = record.get('symbol')
-                airline_id = get_airline_id(cursor, symbol)
-                
-                if not airline_id:
-                    continue
-                
-                rec_date = record.get('date', '')[:10]
-                open_p = record.get('open')
-                close_p = record.get('close')
-                high_p = record.get('high')
-                low_p = record.get('low')
-                volume = record.get('volume')
-                
-                # Calculate metrics
-                ret_pct = round(((close_p - open_p) / open_p) * 100, 4) if open_p and close_p else None
-                price_rng = round(high_p - low_p, 4) if high_p and low_p else None
-                
-                try:
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO stock_history 
-                        (airline_id, record_date, open_price, close_price, 
-                         high_price, low_price, volume, return_percentage, price_range)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (airline_id, rec_date, open_p, close_p, high_p, low_p, 
-                          volume, ret_pct, price_rng))
-                    
-                    if cursor.rowcount > 0:
-                        items_saved += 1
-                        total_records += 1
-                        print(f"  ✓ {symbol} {rec_date} ({items_saved}/{items_per_run})")
-                except Exception as e:
-                    print(f"  Error: {e}")
-            
+            # slice only after already-saved rows are dropped, otherwise a limit
+            # smaller than a page keeps re-reading the same saved rows
+            rows = drop_existing_rows(conn, build_stock_rows(records, airline_ids))
+            truncated = len(rows) > items_per_run - items_saved
+            rows = rows[:items_per_run - items_saved]
+
+            # rows and progress commit together, one transaction per page
+            with conn:
+                inserted = save_stock_rows(conn, rows)
+                items_saved += inserted
+                total_records += inserted
+                update_progress(conn, current_date if truncated else current_date + timedelta(days=1),
+                                total_records)
+            print(f"  ✓ {inserted} new records ({items_saved}/{items_per_run})")
+
+            if truncated:
+                # run limit hit mid-day: the next run resumes this same day
+                break
+
         except requests.exceptions.RequestException as e:
             print(f"  Request failed: {e}")
             break
@@ -213,8 +450,7 @@ def fetch_stock_data(access_key, db_path=DATABASE_NAME, items_per_run=100):
         current_date += timedelta(days=1)
     
     # Update progress
-    cursor.execute('UPDATE fetch_progress SET last_fetch_date = ?, total_records = ? WHERE id = 1',
-                   (current_date.strftime("%Y-%m-%d"), total_records))
+    update_progress(conn, current_date, total_records)
     
     conn.commit()
     conn.close()
@@ -228,7 +464,14 @@ def fetch_stock_data(access_key, db_path=DATABASE_NAME, items_per_run=100):
     else:
         print(f" Need {100 - total_records} more. Run this script again!")
     print("=" * 60)
+    return items_saved
 
 
 if __name__ == "__main__":
-    fetch_stock_data(MARKETSTACK_API_KEY)
+    if len(sys.argv) > 1 and sys.argv[1] == "range":
+        with get_metrics().stage("fetch_stock_range") as st:
+            st.add(written=fetch_stock_data_range(MARKETSTACK_API_KEY))
+    else:
+        with get_metrics().stage("fetch_stock") as st:
+            st.add(written=fetch_stock_data(MARKETSTACK_API_KEY))
+    get_client().print_latency_summary()
@@ -1,8 +1,14 @@
 import requests
 import sqlite3
-import json
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date, timedelta, datetime
 from config import WEATHERSTACK_API_KEY 
+from ingest_client import get_client
+from metrics import get_metrics
+from payload_store import create_payload_table, save_payloads, delete_payloads
+from weather_tables import (create_weather_hourly_table, save_hourly,
+                            create_daily_weather_summary_table, refresh_daily_weather_summary)
 
 def create_db_table(db_path):
     conn = sqlite3.connect(db_path)
@@ -19,6 +25,12 @@ def create_db_table(db_path):
             UNIQUE(location, record_date)
         )
     ''')
+    # raw json lives compressed in weather_history_payload, keyed by row id
+    create_payload_table(conn, "weather_history")
+    # typed hourly rows for the processing scripts
+    create_weather_hourly_table(conn)
+    # per-day wind/precip/severity, refreshed after every save
+    create_daily_weather_summary_table(conn)
     conn.commit()
     conn.close()
 
@@ -31,16 +43,20 @@ def save_to_db(db_path, location, weather_data):
         avg_temp = details.get('avgtemp')
         min_temp = details.get('mintemp')
         max_temp = details.get('maxtemp')
-        full_json_str = json.dumps(details)
         try:
+            # REPLACE gives the row a new id, so drop the old payload first
+            delete_payloads(conn, "weather_history", "location = ? AND record_date = ?", (location, date_str))
             cursor.execute('''
                 INSERT OR REPLACE INTO weather_history 
                 (location, record_date, avg_temp, min_temp, max_temp, full_data_json)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (location, date_str, avg_temp, min_temp, max_temp, full_json_str))
+                VALUES (?, ?, ?, ?, ?, NULL)
+            ''', (location, date_str, avg_temp, min_temp, max_temp))
+            save_payloads(conn, "weather_history", [(cursor.lastrowid, details)])
+            save_hourly(conn, location, date_str, details)
             count = count + 1
         except Exception as e:
             print(f"Error saving data for {date_str}: {e}")
+    refresh_daily_weather_summary(conn)
     conn.commit()
     conn.close()
     return count
@@ -80,43 +96,120 @@ def fetch_weather_data(access_key, location, db_path='weather_data.db'):
 
     # API request
     print(f"--- Fetching range: {str_start} to {str_end} ---")
-    
+    historical = fetch_weather_window(access_key, location, start_date, end_date)
+
+    if historical:
+        saved_count = save_to_db(db_path, location, historical)
+        
+        # progress Report
+        remaining_days = (final_target_date - end_date).days
+        if remaining_days < 0: remaining_days = 0
+        
+        print(f"Successfully saved {saved_count} days of data.")
+        print(f"Remaining days to target {final_target_date}: {remaining_days} days.")
+        return saved_count
+    elif historical is not None:
+        print("No historical data returned.")
+
+def fetch_weather_window(access_key, location, start_date, end_date):
+    # returns the 'historical' dict (date -> details), or None if the request failed
     base_url = "http://api.weatherstack.com/historical"
     params = {
         'access_key': access_key,
         'query': location,
-        'historical_date_start': str_start,
-        'historical_date_end': str_end,
+        'historical_date_start': start_date.strftime("%Y-%m-%d"),
+        'historical_date_end': end_date.strftime("%Y-%m-%d"),
         'hourly': 1,
         'units': 'm'
     }
 
     try:
-        response = requests.get(base_url, params=params)
+        response = get_client().get("weatherstack", base_url, params=params, timeout=30)
         response.raise_for_status()
         data = response.json()
-        
-        if data.get('success') is False:
-            print(f"API error: {data.get('error')}")
-            return
-        
-        historical = data.get('historical')
-        if historical:
-            saved_count = save_to_db(db_path, location, historical)
-            
-            # progress Report
-            remaining_days = (final_target_date - end_date).days
-            if remaining_days < 0: remaining_days = 0
-            
-            print(f"Successfully saved {saved_count} days of data.")
-            print(f"Remaining days to target {final_target_date}: {remaining_days} days.")
-        else:
-            print("No historical data returned.")
-            
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
         print(f"Request failed: {e}")
+        return None
+
+    if data.get('success') is False:
+        print(f"API error: {data.get('error')}")
+        return None
+
+    return data.get('historical') or {}
+
+def find_missing_ranges(db_path, location, start_date, end_date, batch_size=25):
+    # every gap in [start_date, end_date] for this location, split into
+    # windows of at most batch_size days (one API call each)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT record_date FROM weather_history WHERE location = ? AND record_date BETWEEN ? AND ?",
+        (location, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"))
+    )
+    have = {row[0] for row in cursor.fetchall()}
+    conn.close()
+
+    ranges = []
+    range_start = None
+    current = start_date
+    while current <= end_date:
+        missing = current.strftime("%Y-%m-%d") not in have
+        if missing and range_start is None:
+            range_start = current
+        if range_start is not None and (not missing or (current - range_start).days + 1 > batch_size):
+            ranges.append((range_start, current - timedelta(days=1)))
+            range_start = current if missing else None
+        current += timedelta(days=1)
+    if range_start is not None:
+        ranges.append((range_start, end_date))
+    return ranges
+
+def backfill_weather(access_key, locations, db_path='weather_data.db',
+                     start_date=date(2025, 1, 1), end_date=date(2025, 12, 12), max_workers=4):
+    # fill every missing date range for every location; windows are fetched
+    # in parallel (the ingest client applies the weatherstack rate limit),
+    # results are saved on this thread
+    create_db_table(db_path)
+
+    jobs = []
+    for location in locations:
+        gaps = find_missing_ranges(db_path, location, start_date, end_date)
+        missing_days = sum((end - start).days + 1 for start, end in gaps)
+        print(f"--- {location}: {missing_days} missing days in {len(gaps)} windows ---")
+        jobs.extend((location, start, end) for start, end in gaps)
+
+    if not jobs:
+        print("--- All locations are complete. ---")
+        return 0
+
+    saved_total = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(fetch_weather_window, access_key, location, start, end): (location, start, end)
+            for location, start, end in jobs
+        }
+        for fut in as_completed(futures):
+            location, start, end = futures[fut]
+            historical = fut.result()
+            if historical is None:
+                failed += 1
+                continue
+            saved = save_to_db(db_path, location, historical) if historical else 0
+            saved_total += saved
+            print(f"{location} {start} to {end}: saved {saved} days")
+
+    print(f"--- Backfill done: saved {saved_total} days, {failed} windows failed ---")
+    return saved_total
 
 if __name__ == "__main__": 
     API_KEY = WEATHERSTACK_API_KEY 
     LOCATION = "New York"
-    fetch_weather_data(API_KEY, LOCATION)
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        # python "fetch_weather_data(Zuming).py" backfill "New York" "Chicago" ...
+        with get_metrics().stage("backfill_weather") as st:
+            st.add(written=backfill_weather(API_KEY, sys.argv[2:] or [LOCATION]))
+    else:
+        with get_metrics().stage("fetch_weather") as st:
+            st.add(written=fetch_weather_data(API_KEY, LOCATION))
+    get_client().print_latency_summary()
\ No newline at end of file
@@ -0,0 +1,207 @@
+"""
+Shared HTTP client for the fetch scripts.
+
+- one keep-alive requests.Session per provider (no new TCP/TLS handshake per call)
+- a token bucket per provider, with limits from config.py
+- retries on connection errors, timeouts, 429 and 5xx, with jittered backoff
+- per-request latency, kept in metrics.py's fixed histogram buckets per
+  endpoint and summarised per provider with print_latency_summary()
+- an on-disk response cache checked first (WZH_HTTP_CACHE=on by default,
+  off or replay; see response_cache.py)
+- optional base-URL override, to point every fetcher at mock_api_server.py
+  (WZH_API_BASE_URL=http://127.0.0.1:8765 or set_base_url())
+
+Usage:
+    from ingest_client import get_client
+    resp = get_client().get("weatherstack", url, params=params, timeout=30)
+"""
+
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import AVIATIONSTACK_RATE_LIMIT, WEATHERSTACK_RATE_LIMIT, MARKETSTACK_RATE_LIMIT
+from metrics import get_metrics, bucket_percentile
+from response_cache import get_cache
+
+PROVIDER_LIMITS = {
+    "aviationstack": AVIATIONSTACK_RATE_LIMIT,
+    "weatherstack": WEATHERSTACK_RATE_LIMIT,
+    "marketstack": MARKETSTACK_RATE_LIMIT,
+}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Send every provider's requests to this scheme://host[:port] instead (keeps the path)
+API_BASE_URL_OVERRIDE = os.environ.get("WZH_API_BASE_URL")
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(max(capacity, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate, capacity=None):
+        with self.lock:
+            self.rate = float(rate)
+            if capacity is not None:
+                self.capacity = float(max(capacity, 1))
+                self.tokens = min(self.tokens, self.capacity)
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.rate <= 0 or self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class IngestClient:
+    def __init__(self, max_retries=3, backoff_base=0.5, backoff_cap=10.0, pool_size=16):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.pool_size = pool_size
+        self.sessions = {}
+        self.buckets = {}
+        self.base_urls = {}
+        self.lock = threading.Lock()
+
+    def session(self, provider):
+        with self.lock:
+            if provider not in self.sessions:
+                sess = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                sess.mount("http://", adapter)
+                sess.mount("https://", adapter)
+                self.sessions[provider] = sess
+            return self.sessions[provider]
+
+    def bucket(self, provider):
+        with self.lock:
+            if provider not in self.buckets:
+                limit = PROVIDER_LIMITS.get(provider, {"per_second": 0, "burst": 1})
+                self.buckets[provider] = TokenBucket(limit["per_second"], limit["burst"])
+            return self.buckets[provider]
+
+    def set_rate_limit(self, provider, per_second, burst=None):
+        self.bucket(provider).set_rate(per_second, burst)
+
+    def set_base_url(self, provider, base_url):
+        """Route a provider's requests to base_url (None restores the real host)."""
+        self.base_urls[provider] = base_url
+
+    def rewrite_url(self, provider, url):
+        base = self.base_urls.get(provider) or API_BASE_URL_OVERRIDE
+        if not base:
+            return url
+        parts = urlsplit(url)
+        return base.rstrip("/") + parts.path + ("?" + parts.query if parts.query else "")
+
+    def backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff; honours a numeric Retry-After header."""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_cap)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def record_latency(self, provider, seconds, url, error=False):
+        get_metrics().record_api(provider, url, seconds, error)
+
+    def get(self, provider, url, params=None, timeout=30):
+        """
+        GET `url` through the provider's pooled session.
+
+        A cached response is returned without touching the network (or
+        CacheMiss raised in replay mode). Transient failures are retried up
+        to max_retries times. If every attempt fails, the last exception is
+        raised, or the last response is returned so the caller's
+        raise_for_status() reports it.
+        """
+        url = self.rewrite_url(provider, url)
+        cache = get_cache()
+        cached = cache.get(url, params)
+        if cached is not None:
+            return cached
+
+        sess = self.session(provider)
+        bucket = self.bucket(provider)
+
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            started = time.perf_counter()
+            try:
+                resp = sess.get(url, params=params, timeout=timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.record_latency(provider, time.perf_counter() - started, url, error=True)
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+                print(f"[{provider}] {type(e).__name__}, retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+
+            self.record_latency(provider, time.perf_counter() - started, url, error=resp.status_code >= 400)
+            if resp.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self.backoff(attempt, resp.headers.get("Retry-After"))
+                print(f"[{provider}] HTTP {resp.status_code}, retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            cache.put(url, params, resp)
+            return resp
+
+    def latency_summary(self):
+        """Return {provider: {count, mean, p50, p95, max}} in seconds (p50/p95 are bucket upper bounds)."""
+        metrics = get_metrics()
+        summary = {}
+        for provider in metrics.api_providers():
+            counts, n, total, longest = metrics.api_latency(provider)
+            if not n:
+                continue
+            max_ms = longest * 1000
+            summary[provider] = {
+                "count": n,
+                "mean": total / n,
+                "p50": bucket_percentile(counts, 0.50, max_ms) / 1000,
+                "p95": bucket_percentile(counts, 0.95, max_ms) / 1000,
+                "max": longest,
+            }
+        return summary
+
+    def print_latency_summary(self):
+        cache = get_cache()
+        if cache.hits or cache.misses:
+            print(f"[cache] mode={cache.mode} hits={cache.hits} misses={cache.misses}")
+        for provider, s in self.latency_summary().items():
+            print(f"[{provider}] requests={s['count']} mean={s['mean'] * 1000:.0f}ms "
+                  f"p50={s['p50'] * 1000:.0f}ms p95={s['p95'] * 1000:.0f}ms max={s['max'] * 1000:.0f}ms")
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide shared client, so every fetcher reuses the same pools and buckets."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = IngestClient()
+        return _client
@@ -1,11 +1,39 @@
 # main programm
+import json
+import os
+import re
 import sqlite3
+import time
 from pathlib import Path
 import sys
+from daily_fact import refresh_daily_fact
+from db_utils import connect, INDEXES, create_index
+from metrics import get_metrics
+from payload_store import PAYLOAD_TABLES, payload_table
 
 FINAL_DB = "wzh_project.db"
 SOURCE_DBS = ["flight_data.db", "weather_data.db", "stock_data.db"]
 
+# rowid-growing tables whose writers rewrite a whole group of rows (a weather
+# day's hours) -> the AUTOINCREMENT log that records every rewritten group,
+# and the group columns (leading one indexed). Each group logged since the
+# last merge is replaced whole, so hours missing from a re-fetch, or a day
+# rewritten to no hours at all, don't linger in the final db.
+REPLACE_GROUPS = {
+    "weather_hourly": ("weather_hourly_days", ["record_date", "location"]),
+    "weather_hourly_days": ("weather_hourly_days", ["record_date", "location"]),
+}
+
+# keyed tables kept by an incremental refresher -> the state table it updates
+# on every change; while MAX(rowid) and the state rows match the last merge,
+# the table is skipped without diffing
+DERIVED_STATE = {
+    "daily_weather_summary": "daily_weather_summary_state",
+    "weekly_wind_agg": "weekly_wind_agg_state",
+    "stock_rolling_metrics": "stock_rolling_state",
+    "flight_delay_sketch": "flight_delay_sketch_state",
+}
+
 def table_list(conn):
     cur = conn.cursor()
     cur.execute("""
@@ -14,60 +42,314 @@ def table_list(conn):
     """)
     return [r[0] for r in cur.fetchall()]
 
-def table_exists(conn, name):
+def table_exists(conn, name, schema="main"):
     cur = conn.cursor()
-    cur.execute("""
-        SELECT 1 FROM sqlite_master
+    cur.execute(f"""
+        SELECT 1 FROM {schema}.sqlite_master
         WHERE type='table' AND name=?
     """, (name,))
     return cur.fetchone() is not None
 
-def merge_one(source_db, final_db):
+def create_merge_state(conn):
+    # per (source db, table): last source rowid copied (rowid-growing tables)
+    # or the change mark seen at the last merge (keyed tables)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS merge_state (
+            source_db TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            high_water INTEGER NOT NULL,
+            change_mark TEXT,
+            PRIMARY KEY (source_db, table_name)
+        )
+    """)
+
+def grows_by_rowid(conn, table, schema="main"):
+    """
+    True when new or changed rows always get a rowid above every earlier one:
+    AUTOINCREMENT tables (ids are never reused, INSERT OR REPLACE issues a
+    new id), which includes the payload side tables.
+    """
+    cur = conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type='table' AND name='sqlite_sequence'")
+    if cur.fetchone() is None:
+        return False
+    cur = conn.execute(f"SELECT 1 FROM {schema}.sqlite_sequence WHERE name=?", (table,))
+    return cur.fetchone() is not None
+
+def column_names(conn, table, schema="main"):
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+def primary_key(conn, table, schema="main"):
+    return [name for _, name in sorted((r[5], r[1]) for r in conn.execute(f"PRAGMA {schema}.table_info({table})")
+                                       if r[5])]
+
+def table_sql(conn, table, schema="main"):
+    row = conn.execute(f"SELECT sql FROM {schema}.sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+    return " ".join(row[0].split()) if row and row[0] else None
+
+def in_groups(table, group):
+    """WHERE condition: the row of `table` belongs to a group in temp.merge_groups."""
+    match = " AND ".join(f"g.{c} IS {table}.{c}" for c in group)
+    return (f"{group[0]} IN (SELECT {group[0]} FROM temp.merge_groups) "
+            f"AND EXISTS (SELECT 1 FROM temp.merge_groups g WHERE {match})")
+
+def change_mark(dst, table):
+    """MAX(rowid) of src.table plus its refresher's state rows (None when the table has no state table)."""
+    state = DERIVED_STATE.get(table)
+    if state is None or not table_exists(dst, state, "src"):
+        return None
+    max_rowid = dst.execute(f"SELECT MAX(rowid) FROM src.{table}").fetchone()[0]
+    return json.dumps([max_rowid, dst.execute(f"SELECT * FROM src.{state} ORDER BY 1").fetchall()])
+
+def merge_by_key(dst, t, cols, key):
+    """
+    Bring main.t in line with src.t by primary key, writing only what
+    differs: rows new or changed in the source are upserted, keys gone from
+    the source are deleted. Returns the number of rows written.
+    """
+    before = dst.total_changes
+    col_list = ", ".join(cols)
+    dst.execute("DROP TABLE IF EXISTS temp.merge_changed")
+    dst.execute(f"""
+        CREATE TEMP TABLE merge_changed AS
+        SELECT {col_list} FROM src.{t} EXCEPT SELECT {col_list} FROM main.{t}
+    """)
+    dst.execute(f"""
+        DELETE FROM main.{t} WHERE NOT EXISTS (
+            SELECT 1 FROM src.{t} s WHERE {" AND ".join(f"s.{c} IS main.{t}.{c}" for c in key)}
+        )
+    """)
+
+    key_set = " AND ".join(f"{c} IS NOT NULL" for c in key)
+    updates = ", ".join(f"{c} = excluded.{c}" for c in cols if c not in key)
+    dst.execute(f"""
+        INSERT INTO main.{t} ({col_list})
+        SELECT {col_list} FROM temp.merge_changed WHERE {key_set}
+        ON CONFLICT ({", ".join(key)}) DO {"UPDATE SET " + updates if updates else "NOTHING"}
+    """)
+    # NULL key columns never conflict, so those rows are replaced by hand
+    dst.execute(f"""
+        DELETE FROM main.{t} WHERE NOT ({key_set}) AND EXISTS (
+            SELECT 1 FROM temp.merge_changed k WHERE {" AND ".join(f"k.{c} IS main.{t}.{c}" for c in key)}
+        )
+    """)
+    dst.execute(f"INSERT INTO main.{t} ({col_list}) SELECT {col_list} FROM temp.merge_changed WHERE NOT ({key_set})")
+    dst.execute("DROP TABLE temp.merge_changed")
+    return dst.total_changes - before
+
+def copy_indexes(dst):
+    """Create the attached source's own indexes on the final tables (IF NOT EXISTS)."""
+    rows = dst.execute("""
+        SELECT name, tbl_name, sql FROM src.sqlite_master
+        WHERE type='index' AND sql IS NOT NULL
+    """).fetchall()
+    for name, table, sql in rows:
+        if not table_exists(dst, table):
+            continue
+        if dst.execute("SELECT 1 FROM main.sqlite_master WHERE type='index' AND name=?", (name,)).fetchone():
+            continue
+        sql = re.sub(r"^CREATE\s+(UNIQUE\s+)?INDEX\s+(IF\s+NOT\s+EXISTS\s+)?", r"CREATE \1INDEX IF NOT EXISTS ",
+                     sql, flags=re.IGNORECASE)
+        dst.execute(sql)
+        print(f"  + Index: {name} on {table}")
+
+def optimize_final(final_db):
+    """The shared covering indexes (db_utils.INDEXES), then fresh planner statistics."""
+    conn = connect(final_db)
+    for name, (table, _) in INDEXES.items():
+        if table_exists(conn, table):
+            create_index(conn, name)
+    conn.commit()
+    # sampled ANALYZE keeps this quick on large tables
+    conn.execute("PRAGMA analysis_limit=1000")
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+    conn.close()
+    print("Indexes checked, statistics updated (ANALYZE)")
+
+def merge_one(source_db, final_db, chunk_rows=50000):
+    """
+    Copy new/changed rows of every table in source_db into final_db.
+
+    The source is ATTACHed and rows move with INSERT ... SELECT inside
+    SQLite, all in one transaction per source database: memory stays flat
+    and no value passes through Python. Rowid-growing tables copy the rows
+    past the last merge's mark (in rowid chunks of chunk_rows, for progress
+    output); keyed tables upsert only the keys that differ. A table whose
+    schema changed in the source is recreated and copied whole. Returns the
+    number of rows written.
+    """
     if not Path(source_db).exists():
         print(f"Skip (not found): {source_db}")
-        return
+        return 0
 
-    src = sqlite3.connect(source_db)
-    dst = sqlite3.connect(final_db)
+    dst = connect(final_db, isolation_level=None)
+    dst.execute("ATTACH DATABASE ? AS src", (source_db,))
+    source_key = Path(source_db).name
 
-    src_tables = table_list(src)
+    src_tables = [r[0] for r in dst.execute("""
+        SELECT name FROM src.sqlite_master
+        WHERE type='table' AND name NOT LIKE 'sqlite_%'
+    """)]
     print(f"[{source_db}] tables: {src_tables}")
 
-    for t in src_tables:
-        if table_exists(dst, t):
-            print(f"  - Skip (already exists in final): {t}")
-            continue
+    written = 0
+    dst.execute("BEGIN")
+    try:
+        create_merge_state(dst)
+        # where each group log stood at the last merge, read before the
+        # loop copies the logs and moves their marks
+        log_marks = {}
+        for t, (log, _) in REPLACE_GROUPS.items():
+            row = dst.execute("SELECT high_water FROM merge_state WHERE source_db=? AND table_name=?",
+                              (source_key, log)).fetchone()
+            log_marks[t] = row[0] if row else 0
+        for t in src_tables:
+            src_sql = table_sql(dst, t, "src")
+            if src_sql is None:
+                print(f"  ! Skip (no CREATE sql): {t}")
+                continue
+            if table_exists(dst, t) and table_sql(dst, t) != src_sql:
+                # schema changed upstream (a migration rebuilt it): start over
+                dst.execute(f"DROP TABLE main.{t}")
+                dst.execute("DELETE FROM merge_state WHERE table_name=?", (t,))
+                print(f"  ~ Schema changed, recreating: {t}")
+            if not table_exists(dst, t):
+                dst.execute(dst.execute("SELECT sql FROM src.sqlite_master WHERE type='table' AND name=?",
+                                        (t,)).fetchone()[0])
+            table_started = time.perf_counter()
 
-        cur = src.cursor()
-        cur.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (t,))
-        row = cur.fetchone()
-        if not row or not row[0]:
-            print(f"  ! Skip (no CREATE sql): {t}")
-            continue
+            # explicit column list, so an older final-db schema still lines up
+            dst_cols = set(column_names(dst, t))
+            src_cols = [c for c in column_names(dst, t, "src") if c in dst_cols]
+            cols = ", ".join(src_cols)
+            row = dst.execute("SELECT high_water, change_mark FROM merge_state WHERE source_db=? AND table_name=?",
+                              (source_key, t)).fetchone()
+            high_water, last_mark = row if row else (0, None)
 
-        create_sql = row[0]
-        dst.execute(create_sql)
+            if grows_by_rowid(dst, t, "src"):
+                # upsert only rows past the mark; the table's PRIMARY KEY /
+                # UNIQUE constraints replace the older copy of a changed row
+                max_rowid = dst.execute(f"SELECT MAX(rowid) FROM src.{t}").fetchone()[0] or 0
+                start_mark = high_water
+                copied = 0
+                log, group = REPLACE_GROUPS.get(t, (None, None))
+                if log and table_exists(dst, log, "src"):
+                    # groups rewritten since the last merge: drop all their
+                    # rows, then take back what the source holds at or below
+                    # the mark (the chunks below bring the rest)
+                    dst.execute("DROP TABLE IF EXISTS temp.merge_groups")
+                    dst.execute(f"CREATE TEMP TABLE merge_groups AS SELECT DISTINCT {', '.join(group)} "
+                                f"FROM src.{log} WHERE rowid > ?", (log_marks[t],))
+                    dst.execute(f"DELETE FROM main.{t} WHERE {in_groups(f'main.{t}', group)}")
+                    cur = dst.execute(f"""
+                        INSERT OR REPLACE INTO main.{t} ({cols})
+                        SELECT {cols} FROM src.{t} WHERE rowid <= ? AND {in_groups(f'src.{t}', group)}
+                    """, (high_water,))
+                    copied += max(cur.rowcount, 0)
+                    dst.execute("DROP TABLE temp.merge_groups")
+                while high_water < max_rowid:
+                    upper = min(high_water + chunk_rows, max_rowid)
+                    cur = dst.execute(f"""
+                        INSERT OR REPLACE INTO main.{t} ({cols})
+                        SELECT {cols} FROM src.{t} WHERE rowid > ? AND rowid <= ?
+                    """, (high_water, upper))
+                    copied += max(cur.rowcount, 0)
+                    high_water = upper
+                    if max_rowid - start_mark > chunk_rows:
+                        print(f"    {t}: rowid {high_water}/{max_rowid}, {copied} rows so far")
+                if copied and t in [payload_table(h) for h in PAYLOAD_TABLES]:
+                    # payloads of history rows that an upsert replaced
+                    history = t[:-len("_payload")]
+                    dst.execute(f"DELETE FROM main.{t} WHERE row_id NOT IN (SELECT id FROM main.{history})")
+                    # payload_store migrate moves inline json out without a new history id
+                    dst.execute(f"""
+                        UPDATE main.{history} SET full_data_json = NULL
+                        WHERE full_data_json IS NOT NULL AND id IN (SELECT row_id FROM main.{t})
+                    """)
+                if high_water != start_mark:
+                    dst.execute("INSERT OR REPLACE INTO merge_state (source_db, table_name, high_water) VALUES (?, ?, ?)",
+                                (source_key, t, high_water))
+                written += copied
+                print(f"  + {t}: {copied} rows copied (rowid > {start_mark}) "
+                      f"in {time.perf_counter() - table_started:.2f}s")
+                continue
 
-        rows = src.execute(f"SELECT * FROM {t}").fetchall()
-        if rows:
-            placeholders = ",".join(["?"] * len(rows[0]))
-            dst.executemany(f"INSERT INTO {t} VALUES ({placeholders})", rows)
+            # progress/summary tables rewritten in place
+            mark = change_mark(dst, t)
+            key = primary_key(dst, t, "src")
+            if mark is not None and mark == last_mark:
+                print(f"  = {t}: unchanged since the last merge")
+                continue
+            if key and set(key) <= set(src_cols):
+                changed = merge_by_key(dst, t, src_cols, key)
+                how = "by key"
+            else:
+                # no primary key to diff by: copy whole
+                dst.execute(f"DELETE FROM main.{t}")
+                changed = max(dst.execute(f"INSERT INTO main.{t} ({cols}) SELECT {cols} FROM src.{t}").rowcount, 0)
+                how = "full copy"
+            print(f"  + {t}: {changed} rows written ({how}) in {time.perf_counter() - table_started:.2f}s")
+            if mark != last_mark:
+                dst.execute("""
+                    INSERT OR REPLACE INTO merge_state (source_db, table_name, high_water, change_mark)
+                    VALUES (?, ?, 0, ?)
+                """, (source_key, t, mark))
+            written += changed
 
-        print(f"  + Copied table: {t} (rows={len(rows)})")
-
-    dst.commit()
-    src.close()
-    dst.close()
+        # indexes after the data, so new tables are loaded first and indexed in one pass
+        copy_indexes(dst)
+        dst.execute("COMMIT")
+    except Exception:
+        dst.execute("ROLLBACK")
+        raise
+    finally:
+        dst.execute("DETACH DATABASE src")
+        dst.close()
+    return written
 
 def merge_databases():
     sqlite3.connect(FINAL_DB).close()
     for db in SOURCE_DBS:
-        merge_one(db, FINAL_DB)
+        with get_metrics().stage(f"merge {db}") as st:
+            st.add(written=merge_one(db, FINAL_DB))
+    with get_metrics().stage("refresh_fact"):
+        refresh_fact(FINAL_DB)
+    with get_metrics().stage("optimize_final"):
+        optimize_final(FINAL_DB)
     print(f"Done. Final DB: {FINAL_DB}")
 
+def refresh_fact(final_db):
+    # only dates with new flight/weather/stock rows are rebuilt
+    conn = connect(final_db)
+    with conn:
+        dates = refresh_daily_fact(conn)
+    conn.close()
+    print(f"daily_fact: refreshed {dates} date(s)")
+
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "merge":
         merge_databases()
+    elif len(sys.argv) > 1 and sys.argv[1] == "fact":
+        refresh_fact(FINAL_DB)
+    elif len(sys.argv) > 1 and sys.argv[1] == "run":
+        import argparse
+        from pipeline import run_pipeline
+
+        parser = argparse.ArgumentParser(prog="main.py run", description="Run fetch -> process -> merge -> visualise")
+        parser.add_argument("--no-fetch", action="store_true", help="skip the API fetch stages")
+        parser.add_argument("--force", action="store_true", help="run every stage even if its inputs are unchanged")
+        parser.add_argument("--workers", type=int, default=4, help="stages run at the same time")
+        parser.add_argument("--verbose", action="store_true", help="print each stage's output")
+        parser.add_argument("--metrics", action="store_true", help="record timings to pipeline_metrics (metrics.py)")
+        args = parser.parse_args(sys.argv[2:])
+        if args.metrics:
+            os.environ["WZH_METRICS"] = "on"
+        status = run_pipeline(fetch=not args.no_fetch, force=args.force, max_workers=args.workers,
+                              verbose=args.verbose)
+        sys.exit(1 if any(s in ("failed", "blocked") for s in status.values()) else 0)
     else:
         print("Usage:")
         print("  python3 main.py merge")
+        print("  python3 main.py fact")
+        print("  python3 main.py run [--no-fetch] [--force] [--workers N] [--verbose] [--metrics]")
@@ -0,0 +1,405 @@
+"""
+Timing and throughput metrics for the pipeline scripts.
+
+Scripts opt in piece by piece:
+
+    from metrics import get_metrics
+    with get_metrics().stage("process_flights") as st:
+        ...
+        st.add(read=rows_in, written=rows_out)
+
+records wall and CPU time (process-wide time.process_time(), so a stage
+running next to busy threads is charged for them too) and rows read/written
+per second. ingest_client.py feeds per-endpoint API latencies into fixed
+histogram buckets (p50/p95 are reported as bucket upper bounds), and connections opened with db_utils.connect() (and
+connect_writer/connect_readonly) time every statement, fetch and commit,
+grouped by the whitespace-normalised SQL text.
+
+Collection is in memory and always on; nothing is written unless
+WZH_METRICS=on. Then, at exit, each process appends its numbers to the
+pipeline_metrics table in pipeline_metrics.db (WZH_METRICS_DB) and rewrites
+pipeline_metrics.json (WZH_METRICS_JSON) with everything recorded for the
+current run. `python main.py run --metrics` gives all stages one run id
+(WZH_METRICS_RUN), so a pipeline run lands together.
+
+    python metrics.py [run_id]     # report, compared with earlier runs
+"""
+
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlsplit
+
+METRICS_DB = os.environ.get("WZH_METRICS_DB", "pipeline_metrics.db")
+METRICS_JSON = os.environ.get("WZH_METRICS_JSON", "pipeline_metrics.json")
+# upper bounds in ms; the last bucket catches everything slower
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# a stage slower than this many times its median over earlier runs (and by
+# more than REGRESSION_MIN_S, so millisecond stages don't flap) is flagged
+REGRESSION_RATIO = 1.5
+REGRESSION_MIN_S = 0.1
+SQL_KEY_CHARS = 200
+
+
+def metrics_enabled():
+    return os.environ.get("WZH_METRICS", "off").lower() == "on"
+
+
+def new_run_id():
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+
+
+def percentile(values, q):
+    """values must be sorted."""
+    return values[int(q * (len(values) - 1))] if values else None
+
+
+def bucket_index(ms):
+    for i, bound in enumerate(LATENCY_BUCKETS_MS):
+        if ms <= bound:
+            return i
+    return len(LATENCY_BUCKETS_MS)
+
+
+def bucket_label(i):
+    return f"<={LATENCY_BUCKETS_MS[i]}" if i < len(LATENCY_BUCKETS_MS) else f">{LATENCY_BUCKETS_MS[-1]}"
+
+
+def bucket_percentile(counts, q, max_ms):
+    """Upper bound (ms) of the bucket holding the q-th latency, capped at the slowest one seen."""
+    rank = int(q * (sum(counts) - 1))
+    for i, n in enumerate(counts):
+        rank -= n
+        if rank < 0:
+            return min(LATENCY_BUCKETS_MS[i], max_ms) if i < len(LATENCY_BUCKETS_MS) else max_ms
+    return None
+
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.rows_read = 0
+        self.rows_written = 0
+        self.status = "ok"
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def add(self, read=0, written=0):
+        self.rows_read += read or 0
+        self.rows_written += written or 0
+
+
+class Metrics:
+    def __init__(self, run_id=None, script=None):
+        self.run_id = run_id or new_run_id()
+        self.script = script or os.path.basename(sys.argv[0] or "python")
+        self.stages = []
+        self.api = {}    # endpoint -> [bucket counts, count, total seconds, max seconds]
+        self.api_errors = {}
+        self.sql = {}    # statement -> [count, total seconds, max seconds, rows]
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        st = Stage(name)
+        wall0, cpu0 = time.perf_counter(), time.process_time()
+        try:
+            yield st
+        except BaseException:
+            st.status = "error"
+            raise
+        finally:
+            st.wall = time.perf_counter() - wall0
+            st.cpu = time.process_time() - cpu0
+            with self.lock:
+                self.stages.append(st)
+
+    def record_stage(self, name, wall, cpu, read=0, written=0, status="ok"):
+        """A stage timed elsewhere (pipeline.py times whole subprocesses)."""
+        st = Stage(name)
+        st.wall, st.cpu, st.status = wall, cpu, status
+        st.add(read, written)
+        with self.lock:
+            self.stages.append(st)
+
+    def record_api(self, provider, url, seconds, error=False):
+        endpoint = f"{provider} {urlsplit(url).path or '/'}"
+        with self.lock:
+            # fixed-size counts, not raw samples, so long fetches don't grow memory
+            entry = self.api.get(endpoint)
+            if entry is None:
+                entry = self.api[endpoint] = [[0] * (len(LATENCY_BUCKETS_MS) + 1), 0, 0.0, 0.0]
+            entry[0][bucket_index(seconds * 1000)] += 1
+            entry[1] += 1
+            entry[2] += seconds
+            entry[3] = max(entry[3], seconds)
+            if error:
+                self.api_errors[endpoint] = self.api_errors.get(endpoint, 0) + 1
+
+    def api_latency(self, provider):
+        """[bucket counts, count, total seconds, max seconds] over all of a provider's endpoints."""
+        merged = [[0] * (len(LATENCY_BUCKETS_MS) + 1), 0, 0.0, 0.0]
+        with self.lock:
+            for endpoint, (counts, count, total, longest) in self.api.items():
+                if endpoint.split(" ", 1)[0] == provider:
+                    merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                    merged[1] += count
+                    merged[2] += total
+                    merged[3] = max(merged[3], longest)
+        return merged
+
+    def api_providers(self):
+        with self.lock:
+            return sorted({endpoint.split(" ", 1)[0] for endpoint in self.api})
+
+    def clear_api(self, provider):
+        """Forget a provider's API latencies (bench_ingest starts each scenario clean)."""
+        with self.lock:
+            for endpoint in [e for e in self.api if e.split(" ", 1)[0] == provider]:
+                del self.api[endpoint]
+                self.api_errors.pop(endpoint, None)
+
+    def record_sql(self, sql, seconds, rows=0):
+        key = " ".join(sql.split())[:SQL_KEY_CHARS]
+        with self.lock:
+            entry = self.sql.get(key)
+            if entry is None:
+                self.sql[key] = [1, seconds, seconds, rows]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+                entry[3] += rows
+
+    def rows(self):
+        """This process's metrics as pipeline_metrics rows (dicts)."""
+        now = datetime.now().isoformat(timespec="seconds")
+        base = {"run_id": self.run_id, "recorded_at": now, "script": self.script}
+        out = []
+        with self.lock:
+            for st in self.stages:
+                out.append(dict(base, kind="stage", name=st.name, count=1, wall_s=st.wall, cpu_s=st.cpu,
+                                rows_read=st.rows_read, rows_written=st.rows_written,
+                                p50_ms=None, p95_ms=None, max_ms=None,
+                                detail={"status": st.status,
+                                        "rows_read_per_s": st.rows_read / st.wall if st.wall else None,
+                                        "rows_written_per_s": st.rows_written / st.wall if st.wall else None}))
+            for endpoint, (counts, count, total, longest) in self.api.items():
+                histogram = {bucket_label(i): n for i, n in enumerate(counts) if n}
+                max_ms = longest * 1000
+                out.append(dict(base, kind="api", name=endpoint, count=count, wall_s=total,
+                                cpu_s=None, rows_read=None, rows_written=None,
+                                p50_ms=bucket_percentile(counts, 0.50, max_ms),
+                                p95_ms=bucket_percentile(counts, 0.95, max_ms),
+                                max_ms=max_ms,
+                                detail={"histogram_ms": histogram, "errors": self.api_errors.get(endpoint, 0)}))
+            for sql, (count, total, longest, n_rows) in self.sql.items():
+                out.append(dict(base, kind="sql", name=sql, count=count, wall_s=total, cpu_s=None,
+                                rows_read=None, rows_written=n_rows or None,
+                                p50_ms=None, p95_ms=None, max_ms=longest * 1000,
+                                detail={"mean_ms": total / count * 1000}))
+        return out
+
+    def flush(self, db_path=METRICS_DB, json_path=METRICS_JSON):
+        rows = self.rows()
+        if not rows:
+            return 0
+        conn = sqlite3.connect(db_path, timeout=30)
+        with conn:
+            create_metrics_table(conn)
+            conn.executemany('''
+                INSERT INTO pipeline_metrics
+                (run_id, recorded_at, script, kind, name, count, wall_s, cpu_s,
+                 rows_read, rows_written, p50_ms, p95_ms, max_ms, detail)
+                VALUES (:run_id, :recorded_at, :script, :kind, :name, :count, :wall_s, :cpu_s,
+                        :rows_read, :rows_written, :p50_ms, :p95_ms, :max_ms, :detail)
+            ''', [dict(r, detail=json.dumps(r["detail"])) for r in rows])
+        with self.lock:
+            self.stages, self.api, self.api_errors, self.sql = [], {}, {}, {}
+        write_run_json(conn, self.run_id, json_path)
+        conn.close()
+        return len(rows)
+
+
+def create_metrics_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pipeline_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT NOT NULL,
+            recorded_at TEXT NOT NULL,
+            script TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            count INTEGER,
+            wall_s REAL,
+            cpu_s REAL,
+            rows_read INTEGER,
+            rows_written INTEGER,
+            p50_ms REAL,
+            p95_ms REAL,
+            max_ms REAL,
+            detail TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_metrics_run ON pipeline_metrics(run_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pipeline_metrics_kind_name ON pipeline_metrics(kind, name, id)")
+
+
+def run_rows(conn, run_id):
+    conn.row_factory = sqlite3.Row
+    rows = [dict(r, detail=json.loads(r["detail"] or "null"))
+            for r in conn.execute("SELECT * FROM pipeline_metrics WHERE run_id = ? ORDER BY id", (run_id,))]
+    conn.row_factory = None
+    return rows
+
+
+def write_run_json(conn, run_id, json_path=METRICS_JSON):
+    rows = run_rows(conn, run_id)
+    tmp = f"{json_path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"run_id": run_id, "metrics": rows}, f, indent=2)
+    os.replace(tmp, json_path)
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Process-wide recorder; flushed at exit when WZH_METRICS=on."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics(run_id=os.environ.get("WZH_METRICS_RUN"))
+            if metrics_enabled():
+                atexit.register(_metrics.flush)
+        return _metrics
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports statement and fetch time to get_metrics()."""
+
+    def execute(self, sql, parameters=()):
+        self._sql = sql
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            get_metrics().record_sql(sql, time.perf_counter() - started, max(self.rowcount, 0))
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql = sql
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            get_metrics().record_sql(sql, time.perf_counter() - started, max(self.rowcount, 0))
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            get_metrics().record_sql(sql_script, time.perf_counter() - started)
+
+    # SELECTs do most of their work while rows are stepped, so fetch time is
+    # charged to the statement that produced the rows
+    def _timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            if getattr(self, "_sql", None):
+                get_metrics().record_sql(self._sql + " -- fetch", time.perf_counter() - started)
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            get_metrics().record_sql("COMMIT", time.perf_counter() - started)
+
+
+def connection_factory():
+    """sqlite3.connect(factory=...) value: timed connections only when metrics are on."""
+    return TimedConnection if metrics_enabled() else sqlite3.Connection
+
+
+def report(db_path=METRICS_DB, run_id=None, history=5):
+    """Print one run (the latest by default), each stage next to its median over earlier runs."""
+    conn = sqlite3.connect(db_path)
+    create_metrics_table(conn)
+    if run_id is None:
+        row = conn.execute("SELECT run_id FROM pipeline_metrics ORDER BY id DESC LIMIT 1").fetchone()
+        if row is None:
+            print("No metrics recorded yet (set WZH_METRICS=on or use main.py run --metrics).")
+            return
+        run_id = row[0]
+    rows = run_rows(conn, run_id)
+    print(f"Run {run_id}")
+
+    print("\nStages:")
+    for r in (r for r in rows if r["kind"] == "stage"):
+        earlier = sorted(x[0] for x in conn.execute('''
+            SELECT wall_s FROM pipeline_metrics
+            WHERE kind = 'stage' AND name = ? AND script = ? AND run_id != ? AND id < ?
+            ORDER BY id DESC LIMIT ?
+        ''', (r["name"], r["script"], run_id, r["id"], history)))
+        median = percentile(earlier, 0.5)
+        flag = ""
+        if median is not None and r["wall_s"] > max(median * REGRESSION_RATIO, median + REGRESSION_MIN_S):
+            flag = f"  <-- {r['wall_s'] / median:.1f}x slower than median {median:.2f}s"
+        throughput = ""
+        for label in ("read", "written"):
+            if r[f"rows_{label}"]:
+                throughput += f" {label}={r[f'rows_{label}']} ({r['detail'][f'rows_{label}_per_s']:.0f}/s)"
+        cpu = "n/a" if r["cpu_s"] is None else f"{r['cpu_s']:.2f}s"
+        print(f"  {r['script']:<34} {r['name']:<22} wall={r['wall_s']:.2f}s cpu={cpu}"
+              f"{throughput} [{r['detail']['status']}]{flag}")
+
+    api = [r for r in rows if r["kind"] == "api"]
+    if api:
+        print("\nAPI latency:")
+        for r in api:
+            print(f"  {r['name']:<40} n={r['count']} p50={r['p50_ms']:.0f}ms p95={r['p95_ms']:.0f}ms "
+                  f"max={r['max_ms']:.0f}ms errors={r['detail']['errors']} {r['detail']['histogram_ms']}")
+
+    sql = sorted((r for r in rows if r["kind"] == "sql"), key=lambda r: -r["wall_s"])[:10]
+    if sql:
+        print("\nSlowest SQL (total time):")
+        for r in sql:
+            print(f"  {r['wall_s']:.3f}s n={r['count']} max={r['max_ms']:.1f}ms  {r['name'][:100]}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    report(run_id=sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,309 @@
+"""
+Local stand-in for the aviationstack, weatherstack and marketstack APIs.
+
+Serves seeded synthetic data in each provider's response shape, so the
+fetchers can be load-tested offline:
+    GET /v1/flights    aviationstack  (dep_iata, flight_date, limit<=100, offset)
+    GET /historical    weatherstack   (query, historical_date_start/_end, hourly)
+    GET /v1/eod        marketstack    (symbols, date_from, date_to, limit<=1000, offset)
+
+The same seed always produces the same payloads. Latency, a server-side
+rate limit (HTTP 429 + Retry-After) and a random 5xx error rate are
+configurable. A request without access_key gets the provider's error body.
+
+Usage:
+    python mock_api_server.py --port 8765 --latency-ms 40 --rate-limit 50
+    WZH_API_BASE_URL=http://127.0.0.1:8765 python "fetch_flight_data(Ke).py"
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+AIRLINES = [
+    ("Delta Air Lines", "DL"), ("JetBlue Airways", "B6"), ("American Airlines", "AA"),
+    ("United Airlines", "UA"), ("Alaska Airlines", "AS"), ("Southwest Airlines", "WN"),
+]
+DESTINATIONS = ["LAX", "SFO", "ORD", "ATL", "MIA", "SEA", "BOS", "DFW", "DEN", "LAS"]
+STATUSES = ["landed"] * 8 + ["active", "scheduled", "cancelled", "diverted"]
+BASE_PRICES = {"JBLU": 6.0, "DAL": 45.0, "AAL": 14.0, "UAL": 50.0}
+
+
+def seeded(seed, *parts):
+    """A Random whose stream depends only on seed and parts (stable across runs)."""
+    return random.Random(zlib.crc32(":".join(str(p) for p in (seed,) + parts).encode("utf-8")))
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def flight_count(seed, airport, day):
+    return seeded(seed, "count", airport, day).randint(150, 400)
+
+
+def make_flight(seed, airport, day, i):
+    rng = seeded(seed, "flight", airport, day, i)
+    airline, code = AIRLINES[rng.randrange(len(AIRLINES))]
+    number = 100 + (i * 7919 + rng.randrange(50)) % 9000
+    status = rng.choice(STATUSES)
+    scheduled = f"{day}T{rng.randrange(5, 23):02d}:{rng.choice(['00', '15', '30', '45'])}:00+00:00"
+    delay = None if rng.random() < 0.35 else int(rng.expovariate(1 / 25.0))
+    return {
+        "flight_date": day,
+        "flight_status": status,
+        "departure": {
+            "airport": f"{airport} International",
+            "iata": airport,
+            "delay": delay,
+            "scheduled": scheduled,
+            "estimated": scheduled,
+            "actual": scheduled if status == "landed" else None,
+        },
+        "arrival": {"iata": rng.choice(DESTINATIONS), "delay": delay},
+        "airline": {"name": airline, "iata": code},
+        "flight": {"number": str(number), "iata": f"{code}{number}"},
+    }
+
+
+def make_weather_day(seed, location, day):
+    rng = seeded(seed, "weather", location, day)
+    base = 12 + 10 * rng.uniform(-1, 1)
+    hourly = []
+    for hour in range(0, 2400, 300):
+        hourly.append({
+            "time": str(hour),
+            "temperature": round(base + rng.uniform(-4, 4)),
+            "wind_speed": rng.randint(0, 45),
+            "wind_dir": rng.choice(["N", "NE", "E", "SE", "S", "SW", "W", "NW"]),
+            "precip": round(max(0.0, rng.gauss(0.1, 0.6)), 1),
+            "humidity": rng.randint(30, 95),
+            "visibility": rng.randint(2, 10),
+            "pressure": rng.randint(995, 1030),
+        })
+    temps = [h["temperature"] for h in hourly]
+    return {
+        "date": day,
+        "mintemp": min(temps),
+        "maxtemp": max(temps),
+        "avgtemp": round(sum(temps) / len(temps)),
+        "totalsnow": 0,
+        "sunhour": round(rng.uniform(2, 12), 1),
+        "uv_index": rng.randint(1, 8),
+        "hourly": hourly,
+    }
+
+
+def make_eod(seed, symbol, day):
+    rng = seeded(seed, "eod", symbol, day)
+    base = BASE_PRICES.get(symbol, 20.0) * (1 + 0.002 * (date.fromisoformat(day).toordinal() % 200 - 100))
+    open_p = round(base * rng.uniform(0.97, 1.03), 2)
+    close_p = round(open_p * rng.uniform(0.95, 1.05), 2)
+    high_p = round(max(open_p, close_p) * rng.uniform(1.0, 1.03), 2)
+    low_p = round(min(open_p, close_p) * rng.uniform(0.97, 1.0), 2)
+    return {
+        "open": open_p, "high": high_p, "low": low_p, "close": close_p,
+        "volume": float(rng.randint(1_000_000, 30_000_000)),
+        "symbol": symbol, "exchange": "XNAS",
+        "date": f"{day}T00:00:00+0000",
+    }
+
+
+class ServerLimiter:
+    """Server-side token bucket; rate <= 0 disables it."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = max(rate, 1)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        if self.rate <= 0:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class MockAPIHandler(BaseHTTPRequestHandler):
+    # set per server in make_server()
+    options = {}
+    limiter = None
+
+    def log_message(self, format, *args):
+        if self.options.get("verbose"):
+            super().log_message(format, *args)
+
+    def send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        opts = self.options
+
+        latency = opts.get("latency_ms", 0) / 1000.0
+        if latency:
+            time.sleep(max(0.0, random.gauss(latency, latency * opts.get("latency_jitter", 0.25))))
+
+        routes = {
+            "/v1/flights": self.flights,
+            "/historical": self.historical,
+            "/v1/eod": self.eod,
+        }
+        handler = routes.get(parts.path.rstrip("/"))
+        if handler is None:
+            self.send_json({"error": {"code": "not_found", "message": parts.path}}, 404)
+            return
+
+        if not self.limiter.allow():
+            self.send_json({"error": {"code": "rate_limit_reached",
+                                      "message": "Too many requests."}}, 429, {"Retry-After": "1"})
+            return
+        if random.random() < opts.get("error_rate", 0.0):
+            self.send_json({"error": {"code": "internal_error", "message": "Injected failure."}}, 503)
+            return
+        handler(params)
+
+    def flights(self, params):
+        if not params.get("access_key"):
+            self.send_json({"error": {"code": "missing_access_key",
+                                      "message": "You have not supplied an API Access Key."}}, 401)
+            return
+        airport = params.get("dep_iata", "JFK")
+        day = parse_date(params.get("flight_date"))
+        if day is None:
+            self.send_json({"error": {"code": "validation_error",
+                                      "message": "flight_date must be YYYY-MM-DD."}}, 422)
+            return
+        day = day.isoformat()
+        limit = min(int(params.get("limit", 100)), 100)
+        offset = int(params.get("offset", 0))
+        seed = self.options.get("seed", 42)
+
+        total = flight_count(seed, airport, day)
+        data = [make_flight(seed, airport, day, i) for i in range(offset, min(offset + limit, total))]
+        self.send_json({
+            "pagination": {"limit": limit, "offset": offset, "count": len(data), "total": total},
+            "data": data,
+        })
+
+    def historical(self, params):
+        if not params.get("access_key"):
+            self.send_json({"success": False, "error": {
+                "code": 101, "type": "missing_access_key",
+                "info": "You have not supplied an API Access Key."}})
+            return
+        start = parse_date(params.get("historical_date_start"))
+        end = parse_date(params.get("historical_date_end")) or start
+        if start is None or end < start or (end - start).days > 60:
+            self.send_json({"success": False, "error": {
+                "code": 614, "type": "invalid_historical_time_frame",
+                "info": "Invalid historical time frame."}})
+            return
+        location = params.get("query", "New York")
+        seed = self.options.get("seed", 42)
+
+        historical = {}
+        day = start
+        while day <= end:
+            historical[day.isoformat()] = make_weather_day(seed, location, day.isoformat())
+            day += timedelta(days=1)
+        self.send_json({
+            "request": {"type": "City", "query": location, "language": "en", "unit": "m"},
+            "location": {"name": location},
+            "historical": historical,
+        })
+
+    def eod(self, params):
+        if not params.get("access_key"):
+            self.send_json({"error": {"code": "missing_access_key",
+                                      "message": "You have not supplied an API Access Key."}}, 401)
+            return
+        symbols = [s for s in params.get("symbols", "").split(",") if s]
+        start = parse_date(params.get("date_from"))
+        end = parse_date(params.get("date_to")) or start
+        if not symbols or start is None:
+            self.send_json({"error": {"code": "validation_error",
+                                      "message": "symbols and date_from are required."}}, 422)
+            return
+        limit = min(int(params.get("limit", 100)), 1000)
+        offset = int(params.get("offset", 0))
+        seed = self.options.get("seed", 42)
+
+        rows = []
+        day = end
+        while day >= start:
+            if day.weekday() < 5:
+                rows.extend(make_eod(seed, symbol, day.isoformat()) for symbol in symbols)
+            day -= timedelta(days=1)
+        page = rows[offset:offset + limit]
+        self.send_json({
+            "pagination": {"limit": limit, "offset": offset, "count": len(page), "total": len(rows)},
+            "data": page,
+        })
+
+
+def make_server(host="127.0.0.1", port=8765, seed=42, latency_ms=0, latency_jitter=0.25,
+                rate_limit=0, error_rate=0.0, verbose=False):
+    """Build a ThreadingHTTPServer with its own options (port=0 picks a free port)."""
+    handler = type("ConfiguredMockAPIHandler", (MockAPIHandler,), {
+        "options": {"seed": seed, "latency_ms": latency_ms, "latency_jitter": latency_jitter,
+                    "error_rate": error_rate, "verbose": verbose},
+        "limiter": ServerLimiter(rate_limit),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_server(**kwargs):
+    """Start a server on a background thread; returns (server, base_url)."""
+    server = make_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock aviationstack/weatherstack/marketstack server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--rate-limit", type=float, default=0, help="requests/s before HTTP 429 (0 = off)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that get HTTP 503")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.seed, args.latency_ms, 0.25,
+                         args.rate_limit, args.error_rate, args.verbose)
+    print(f"Mock API server on http://{args.host}:{args.port} (seed={args.seed})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
@@ -0,0 +1,150 @@
+"""
+Parallel driver for the flight and weather processing.
+
+Both reports partition cleanly by key: flight stats by airport_code and the
+weekly wind report by location. Each shard runs in its own process on a
+read-only connection (file:...?mode=ro) and returns partial sums (counts
+and delay/wind sums, never averages), which the parent merges and hands
+to the same report writers the single-process scripts use, so the output
+files are identical.
+
+The parent does the few writes first (covering indexes, weather_hourly
+backfill), since the read-only workers cannot.
+
+Usage:
+    python parallel_process.py flights [flight_data.db] [workers]
+    python parallel_process.py weather [weather_data.db] [workers]
+"""
+
+import importlib.util
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from db_utils import connect_readonly
+from weather_tables import ensure_weather_hourly
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(filename):
+    # the per-author scripts have parentheses in their names, so they can't
+    # be imported normally
+    spec = importlib.util.spec_from_file_location(Path(filename).stem, os.path.join(BASE_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def flight_shard(db_path, airport_code):
+    """{record_date: (flight_count, delay_sum, delay_n)} for one airport."""
+    conn = connect_readonly(db_path)
+    rows = conn.execute("""
+        SELECT record_date,
+               COUNT(*),
+               SUM(CASE WHEN typeof(dep_delay_min) IN ('integer', 'real') AND dep_delay_min >= 0
+                        THEN dep_delay_min END),
+               COUNT(CASE WHEN typeof(dep_delay_min) IN ('integer', 'real') AND dep_delay_min >= 0
+                          THEN 1 END)
+        FROM flight_history
+        WHERE airport_code = ? AND record_date IS NOT NULL
+        GROUP BY record_date
+    """, (airport_code,)).fetchall()
+    conn.close()
+    return {d: (cnt, delay_sum or 0, delay_n) for d, cnt, delay_sum, delay_n in rows}
+
+
+def weather_shard(db_path, location):
+    """{week_key: (wind_sum, wind_count, start_date, end_date)} for one location."""
+    conn = connect_readonly(db_path)
+    rows = conn.execute("""
+        SELECT record_date, SUM(wind_speed), COUNT(wind_speed)
+        FROM weather_hourly
+        WHERE location IS ?
+        GROUP BY record_date
+    """, (location,)).fetchall()
+    conn.close()
+
+    weeks = {}
+    for date_str, wind_sum, wind_count in rows:
+        try:
+            week = datetime.strptime(date_str, "%Y-%m-%d").strftime("%Y-Week%U")
+        except Exception:
+            continue
+        weeks[week] = merge_week(weeks.get(week), (wind_sum or 0, wind_count, date_str, date_str))
+    return weeks
+
+
+def merge_week(a, b):
+    if a is None:
+        return b
+    return (a[0] + b[0], a[1] + b[1], min(a[2], b[2]), max(a[3], b[3]))
+
+
+def run_shards(func, db_path, keys, max_workers=None):
+    max_workers = max_workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(func, [db_path] * len(keys), keys))
+
+
+def parallel_flight_stats(db_path="flight_data.db", output_file="flight_delay_daily_results.txt",
+                          limit_days=9999999, max_workers=None):
+    """Same report and return value as calculate_daily_flight_stats, one process per airport."""
+    flights = load_script("process_flights_data(Ke).py")
+
+    conn = sqlite3.connect(db_path)
+    if not flights.table_exists(conn, "flight_history"):
+        conn.close()
+        raise RuntimeError("Missing table: flight_history. Run fetch_flight_data first.")
+    flights.create_flight_indexes(conn)
+    airports = [r[0] for r in conn.execute("SELECT DISTINCT airport_code FROM flight_history")]
+    conn.close()
+
+    merged = {}
+    for partial in run_shards(flight_shard, db_path, airports, max_workers):
+        for d, (cnt, delay_sum, delay_n) in partial.items():
+            total = merged.get(d, (0, 0, 0))
+            merged[d] = (total[0] + cnt, total[1] + delay_sum, total[2] + delay_n)
+
+    days = [(d, cnt, delay_sum / delay_n if delay_n else None)
+            for d, (cnt, delay_sum, delay_n) in sorted(merged.items())]
+    unique_days, total_flights, results = flights.write_daily_stats(output_file, db_path, days, limit_days)
+    print(f"Saved calculation file: {output_file} ({len(airports)} airport shard(s))")
+    print(f"Total flights selected: {total_flights}")
+    print(f"Total unique days: {unique_days}")
+    return results
+
+
+def parallel_weather_report(db_path="weather_data.db", output_filename="weekly_avg_wind_speed.txt",
+                            max_workers=None):
+    """Same weekly wind report as process_weather_data, one process per location."""
+    weather = load_script("process_weather_data(Zuming).py")
+
+    conn = sqlite3.connect(db_path)
+    ensure_weather_hourly(conn)
+    locations = [r[0] for r in conn.execute("SELECT DISTINCT location FROM weather_hourly")]
+    conn.close()
+
+    merged = {}
+    for partial in run_shards(weather_shard, db_path, locations, max_workers):
+        for week, totals in partial.items():
+            merged[week] = merge_week(merged.get(week), totals)
+
+    weather.write_weekly_report(output_filename, ((week,) + totals for week, totals in sorted(merged.items())))
+    print(f"Done. Results saved to {output_filename} ({len(locations)} location shard(s))")
+
+
+if __name__ == "__main__":
+    job = sys.argv[1] if len(sys.argv) > 1 else ""
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    if job == "flights":
+        parallel_flight_stats(sys.argv[2] if len(sys.argv) > 2 else "flight_data.db", max_workers=workers)
+    elif job == "weather":
+        parallel_weather_report(sys.argv[2] if len(sys.argv) > 2 else "weather_data.db", max_workers=workers)
+    else:
+        print("Usage:")
+        print("  python3 parallel_process.py flights [flight_data.db] [workers]")
+        print("  python3 parallel_process.py weather [weather_data.db] [workers]")
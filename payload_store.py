@@ -0,0 +1,157 @@
+"""
+Compressed cold storage for raw API payloads (the full_data_json column).
+
+Each history table gets a side table <table>_payload(id, row_id, codec,
+data) keyed by the history row id (row_id), holding the JSON compressed
+with zstd when the zstandard package is installed and zlib otherwise. The
+side table's own AUTOINCREMENT id changes on every write, so a payload
+moved in later by migrate still shows up as new (main.py merge copies
+rows past the last id it saw). New rows are written
+with full_data_json = NULL, so scans of flight_history / weather_history no
+longer pull the raw payloads through the page cache.
+
+Rows written before the migration keep their inline JSON; the accessors
+below (load_payload, payload_query + decode_payload) read either form.
+
+Usage:
+    python payload_store.py migrate flight_data.db weather_data.db
+"""
+
+import json
+import sqlite3
+import sys
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# history tables that carry a full_data_json column
+PAYLOAD_TABLES = ["flight_history", "weather_history"]
+
+
+def payload_table(table):
+    return f"{table}_payload"
+
+
+def create_payload_table(conn, table):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {payload_table(table)} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            row_id INTEGER NOT NULL UNIQUE,
+            codec TEXT NOT NULL,
+            data BLOB NOT NULL
+        )
+    ''')
+
+
+def compress_text(text):
+    """Return (codec, blob) for a JSON string."""
+    raw = text.encode("utf-8")
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=6).compress(raw)
+    return "zlib", zlib.compress(raw, 6)
+
+
+def decompress_text(codec, blob):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Payload is zstd-compressed; install the zstandard package to read it.")
+        return zstandard.ZstdDecompressor().decompress(blob).decode("utf-8")
+    if codec == "zlib":
+        return zlib.decompress(blob).decode("utf-8")
+    raise ValueError(f"Unknown payload codec: {codec}")
+
+
+def save_payloads(conn, table, items):
+    """Store [(row_id, payload_dict), ...] in the side table (caller commits)."""
+    rows = [(row_id,) + compress_text(json.dumps(obj)) for row_id, obj in items]
+    if rows:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {payload_table(table)} (row_id, codec, data) VALUES (?, ?, ?)", rows
+        )
+
+
+def delete_payloads(conn, table, where, params=()):
+    """Drop side rows for history rows matching `where` (before they are replaced)."""
+    conn.execute(
+        f"DELETE FROM {payload_table(table)} WHERE row_id IN (SELECT id FROM {table} WHERE {where})", params
+    )
+
+
+def has_payload_table(conn, table):
+    cur = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (payload_table(table),))
+    return cur.fetchone() is not None
+
+
+def payload_query(conn, table, columns, tail=""):
+    """
+    SELECT the given columns of `table` (aliased h) followed by the three
+    payload columns (inline json, codec, data) that decode_payload() takes.
+    Works whether or not the side table exists yet.
+    """
+    if has_payload_table(conn, table):
+        return (f"SELECT {columns}, h.full_data_json, p.codec, p.data FROM {table} h "
+                f"LEFT JOIN {payload_table(table)} p ON p.row_id = h.id {tail}")
+    return f"SELECT {columns}, h.full_data_json, NULL, NULL FROM {table} h {tail}"
+
+
+def decode_payload(inline_json, codec, data):
+    """Parsed payload dict from either the side table or the inline column (None if neither)."""
+    if data is not None:
+        return json.loads(decompress_text(codec, data))
+    if inline_json:
+        return json.loads(inline_json)
+    return None
+
+
+def load_payload(conn, table, row_id):
+    row = conn.execute(payload_query(conn, table, "h.id", "WHERE h.id = ?"), (row_id,)).fetchone()
+    return decode_payload(*row[1:]) if row else None
+
+
+def migrate_table(conn, table, batch_size=500):
+    """Move inline full_data_json into the compressed side table; returns rows moved."""
+    create_payload_table(conn, table)
+    moved = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(f'''
+            SELECT id, full_data_json FROM {table}
+            WHERE id > ? AND full_data_json IS NOT NULL
+            ORDER BY id LIMIT ?
+        ''', (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {payload_table(table)} (row_id, codec, data) VALUES (?, ?, ?)",
+                [(row_id,) + compress_text(text) for row_id, text in rows]
+            )
+            conn.executemany(f"UPDATE {table} SET full_data_json = NULL WHERE id = ?",
+                             [(row_id,) for row_id, _ in rows])
+        moved += len(rows)
+        last_id = rows[-1][0]
+    return moved
+
+
+def migrate_db(db_path, vacuum=True):
+    conn = sqlite3.connect(db_path)
+    for table in PAYLOAD_TABLES:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+        if exists:
+            moved = migrate_table(conn, table)
+            print(f"[{db_path}] {table}: moved {moved} payloads to {payload_table(table)}")
+    if vacuum:
+        conn.execute("VACUUM")
+    conn.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "migrate":
+        for path in sys.argv[2:]:
+            migrate_db(path)
+    else:
+        print("Usage:")
+        print("  python3 payload_store.py migrate flight_data.db weather_data.db")
@@ -0,0 +1,215 @@
+"""
+Dependency-aware runner for the whole project (python main.py run).
+
+The scripts form a DAG: fetch -> process/visualise per dataset -> merge ->
+cross-dataset charts. Stages whose dependencies are done run in parallel
+(the flight, weather and stock branches are independent), each as its own
+subprocess.
+
+A stage is skipped make-style when the fingerprint of its input tables
+(max rowid, AUTOINCREMENT sequence and refresh state per table, as in
+query_cache.py)
+matches the one recorded after its last successful run in
+pipeline_state.json, and its output files still exist. Fetch stages read
+from the APIs, so they always run unless --no-fetch is given.
+
+With --metrics (WZH_METRICS=on) every stage reports into one
+pipeline_metrics run, and the runner adds each subprocess's wall and CPU
+time (see metrics.py). CPU time comes from the resource module, so it is
+reported as n/a where that is missing (Windows).
+
+    python main.py run [--no-fetch] [--force] [--workers N] [--verbose] [--metrics]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    import resource
+except ImportError:  # POSIX only
+    resource = None
+
+from db_utils import connect_readonly
+from metrics import get_metrics, metrics_enabled
+from query_cache import table_fingerprint
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = "pipeline_state.json"
+
+# name -> script + args, upstream stages, input tables ({db: [tables] or None
+# for every table}) and output files. inputs=None marks an external input.
+STAGES = {
+    "fetch_flights": {
+        "cmd": ["fetch_flight_data(Ke).py"], "deps": [], "inputs": None, "outputs": [],
+    },
+    "fetch_weather": {
+        "cmd": ["fetch_weather_data(Zuming).py"], "deps": [], "inputs": None, "outputs": [],
+    },
+    "fetch_stock": {
+        "cmd": ["fetch_stock_data(Ronghao).py"], "deps": [], "inputs": None, "outputs": [],
+    },
+    "process_flights": {
+        "cmd": ["process_flights_data(Ke).py"], "deps": ["fetch_flights"],
+        "inputs": {"flight_data.db": ["flight_history"]},
+        "outputs": ["flight_delay_daily_results.txt"],
+    },
+    "process_weather": {
+        "cmd": ["process_weather_data(Zuming).py"], "deps": ["fetch_weather"],
+        "inputs": {"weather_data.db": ["weather_history", "weather_hourly", "weather_hourly_days"]},
+        "outputs": ["weekly_avg_wind_speed.txt"],
+    },
+    "visualise_weather": {
+        "cmd": ["visualisation(Zuming).py"], "deps": ["process_weather"],
+        "inputs": {"weather_data.db": ["weather_history", "weather_hourly", "weather_hourly_days"]},
+        "outputs": ["weather_severity_analysis.png"],
+    },
+    "process_stock": {
+        "cmd": ["process_stock_data(Ronghao).py"], "deps": ["fetch_stock"],
+        "inputs": {"stock_data.db": ["airlines", "stock_history"]},
+        "outputs": ["stock_analysis_results.txt", "airline_comparison.png"],
+    },
+    "merge": {
+        "cmd": ["main.py", "merge"],
+        "deps": ["process_flights", "visualise_weather", "process_stock"],
+        "inputs": {"flight_data.db": None, "weather_data.db": None, "stock_data.db": None},
+        "outputs": ["wzh_project.db"],
+    },
+    "visualise_flights": {
+        "cmd": ["visualisation(Ke).py"], "deps": ["merge"],
+        "inputs": {"wzh_project.db": ["flight_history", "daily_fact", "daily_weather_summary"]},
+        "outputs": ["wind_vs_delay.png", "avg_delay_by_date_bar.png"],
+    },
+}
+
+
+def inputs_fingerprint(inputs):
+    """JSON-able fingerprint of the input tables (missing dbs/tables included as None)."""
+    fingerprint = {}
+    for db, tables in sorted(inputs.items()):
+        path = os.path.join(BASE_DIR, db)
+        if not os.path.exists(path):
+            fingerprint[db] = None
+            continue
+        conn = connect_readonly(path)
+        existing = [r[0] for r in conn.execute("""
+            SELECT name FROM sqlite_master
+            WHERE type='table' AND name NOT LIKE 'sqlite_%'
+            ORDER BY name
+        """)]
+        fingerprint[db] = [table_fingerprint(conn, t) if t in existing else [t, None]
+                           for t in (tables if tables is not None else existing)]
+        conn.close()
+    return json.loads(json.dumps(fingerprint, default=str))
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def is_fresh(name, stage, state):
+    if stage["inputs"] is None:
+        return False
+    outputs_ok = all(os.path.exists(os.path.join(BASE_DIR, o)) for o in stage["outputs"])
+    recorded = state.get(name, {}).get("inputs")
+    return outputs_ok and recorded is not None and recorded == inputs_fingerprint(stage["inputs"])
+
+
+def children_cpu():
+    """CPU seconds of all finished child processes so far (None without the resource module)."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_stage(name, stage, verbose=False):
+    """Run one stage's script; returns (returncode, seconds, cpu seconds or None, output)."""
+    env = dict(os.environ)
+    if metrics_enabled():
+        env["WZH_METRICS_RUN"] = get_metrics().run_id
+    started = time.perf_counter()
+    cpu_before = children_cpu()
+    proc = subprocess.run([sys.executable] + stage["cmd"], cwd=BASE_DIR, env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    elapsed = time.perf_counter() - started
+    # children's totals are process-wide, so stages that finish while this
+    # one runs are counted here too
+    cpu = None if cpu_before is None else children_cpu() - cpu_before
+    if verbose and proc.stdout:
+        print(f"----- {name} -----\n{proc.stdout.rstrip()}")
+    return proc.returncode, elapsed, cpu, proc.stdout
+
+
+def run_pipeline(fetch=True, force=False, max_workers=4, verbose=False, stages=STAGES):
+    """Run the DAG; returns {stage: 'ran' | 'skipped' | 'failed' | 'blocked' | 'off'}."""
+    state_path = os.path.join(BASE_DIR, STATE_FILE)
+    state = load_state(state_path)
+    status = {}
+    get_metrics().script = "pipeline"
+    started = time.perf_counter()
+
+    def ready(name):
+        return name not in status and all(status.get(d) in ("ran", "skipped", "off") for d in stages[name]["deps"])
+
+    def blocked(name):
+        return name not in status and any(status.get(d) in ("failed", "blocked") for d in stages[name]["deps"])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = {}
+        while len(status) < len(stages):
+            for name in stages:
+                if blocked(name):
+                    status[name] = "blocked"
+                    print(f"[pipeline] {name}: blocked (upstream failed)")
+            for name in stages:
+                if name in running.values() or not ready(name):
+                    continue
+                stage = stages[name]
+                if stage["inputs"] is None and not fetch:
+                    status[name] = "off"
+                    print(f"[pipeline] {name}: off (--no-fetch)")
+                elif not force and is_fresh(name, stage, state):
+                    status[name] = "skipped"
+                    print(f"[pipeline] {name}: up to date")
+                else:
+                    print(f"[pipeline] {name}: running {' '.join(stage['cmd'])}")
+                    running[pool.submit(run_stage, name, stage, verbose)] = name
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                stage = stages[name]
+                code, elapsed, cpu, output = fut.result()
+                get_metrics().record_stage(name, elapsed, cpu, status="ok" if code == 0 else "error")
+                if code == 0:
+                    status[name] = "ran"
+                    if stage["inputs"] is not None:
+                        # recorded after the run, so the stage's own writes don't look like new input
+                        state[name] = {"inputs": inputs_fingerprint(stage["inputs"]), "finished": time.time()}
+                        save_state(state_path, state)
+                    print(f"[pipeline] {name}: done in {elapsed:.1f}s")
+                else:
+                    status[name] = "failed"
+                    tail = "\n".join((output or "").rstrip().splitlines()[-10:])
+                    print(f"[pipeline] {name}: FAILED (exit {code}) after {elapsed:.1f}s\n{tail}")
+
+    counts = {s: list(status.values()).count(s) for s in ("ran", "skipped", "failed", "blocked", "off")}
+    print(f"[pipeline] finished in {time.perf_counter() - started:.1f}s: "
+          + ", ".join(f"{n} {s}" for s, n in counts.items() if n))
+    return status
@@ -1,5 +1,6 @@
-import sqlite3
-from collections import defaultdict
+from db_utils import connect, iter_rows, create_index
+from metrics import get_metrics
+from query_cache import cached_query
 
 DB_PATH = "flight_data.db"
 OUTPUT_FILE = "flight_delay_daily_results.txt"
@@ -14,7 +15,58 @@ def table_exists(conn, table_name: str) -> bool:
     return cur.fetchone() is not None
 
 
-def calculate_daily_flight_stats(db_path=DB_PATH, output_file=OUTPUT_FILE, limit_days=9999999):
+def create_flight_indexes(conn):
+    # covering indexes: the daily stats are answered from the index alone,
+    # without touching the (wide) flight_history rows
+    create_index(conn, "idx_flight_history_date_delay")
+    create_index(conn, "idx_flight_history_airport_date_delay")
+    conn.commit()
+
+
+def write_daily_stats(output_file, db_path, days, limit_days=9999999, filters=None, collect=True):
+    """
+    Write the daily stats file from an iterable of (date, flight_count, avg_delay_min)
+    in date order, as the rows arrive.
+
+    Returns:
+        (unique_days, total_flights, results) -- results is None unless collect
+    """
+    results = [] if collect else None
+    unique_days = 0
+    total_flights = 0
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write("Flight Daily Stats (Flight-only)\n")
+        f.write(f"Database: {db_path}\n")
+        f.write("Source table: flight_history\n")
+        if filters:
+            f.write(f"Filters: {filters}\n")
+        f.write("Calculations:\n")
+        f.write("  - flight_count per day\n")
+        f.write("  - avg_delay_min per day (ignores NULL and negative delays)\n\n")
+
+        f.write("Columns:\n")
+        f.write("date\tflight_count\tavg_delay_min\n")
+        f.write("-" * 50 + "\n")
+
+        for d, cnt, avg in days:
+            if unique_days < limit_days:
+                avg_str = "NA" if avg is None else f"{avg:.2f}"
+                f.write(f"{d}\t{cnt}\t{avg_str}\n")
+            unique_days += 1
+            total_flights += cnt
+            if results is not None:
+                results.append((d, cnt, avg))
+
+        f.write("\n")
+        f.write(f"Total unique days: {unique_days}\n")
+        f.write(f"Total flights (rows in flight_history selected): {total_flights}\n")
+        f.write(f"Rows written (limit_days={limit_days}): {min(unique_days, limit_days)}\n")
+    return unique_days, total_flights, results
+
+
+def calculate_daily_flight_stats(db_path=DB_PATH, output_file=OUTPUT_FILE, limit_days=9999999,
+                                 airport_code=None, start_date=None, end_date=None,
+                                 stream=False, batch_size=1000):
     """
     Uses ONLY flight_history in flight_data.db.
     Selects data from SQLite, calculates:
@@ -22,69 +74,71 @@ def calculate_daily_flight_stats(db_path=DB_PATH, output_file=OUTPUT_FILE, limit
       - average departure delay per day (ignoring NULL and negative delays)
     Writes a clear text output file.
 
+    The aggregation runs inside SQLite (GROUP BY over a covering index).
+    Optional filters: airport_code, start_date / end_date (YYYY-MM-DD, inclusive).
+
+    The per-day rows come from query_cache.db while flight_history is
+    unchanged. With stream=True the cache is skipped and days are read
+    batch_size at a time, written as they arrive and not collected, so
+    memory stays flat however many days the table covers.
+
     Returns:
         list of tuples: (date, flight_count, avg_delay_min)
+        (None when stream=True)
     """
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cur = conn.cursor()
 
     if not table_exists(conn, "flight_history"):
         conn.close()
         raise RuntimeError("Missing table: flight_history. Run fetch_flight_data first.")
 
-    query = """
-        SELECT record_date, dep_delay_min
+    create_flight_indexes(conn)
+
+    where = ["record_date IS NOT NULL"]
+    params = []
+    if airport_code is not None:
+        where.append("airport_code = ?")
+        params.append(airport_code)
+    if start_date is not None:
+        where.append("record_date >= ?")
+        params.append(start_date)
+    if end_date is not None:
+        where.append("record_date <= ?")
+        params.append(end_date)
+    filters = None
+    if params:
+        filters = f"airport_code={airport_code or 'ALL'}, start_date={start_date or '-'}, end_date={end_date or '-'}"
+
+    # AVG skips the NULLs produced by the CASE, i.e. NULL, negative and
+    # non-numeric delays, same as the old python loop
+    query = f"""
+        SELECT record_date,
+               COUNT(*),
+               AVG(CASE WHEN typeof(dep_delay_min) IN ('integer', 'real') AND dep_delay_min >= 0
+                        THEN dep_delay_min END)
         FROM flight_history
-        WHERE record_date IS NOT NULL
+        WHERE {" AND ".join(where)}
+        GROUP BY record_date
+        ORDER BY record_date
     """
-    cur.execute(query)
-    rows = cur.fetchall()
+    with get_metrics().stage("process_flights") as st:
+        if stream:
+            cur.execute(query, params)
+            days = iter_rows(cur, batch_size)
+        else:
+            # per-day rows are small; reuse them until flight_history changes
+            days = cached_query(conn, query, params, ["flight_history"])
+
+        unique_days, total_flights, results = write_daily_stats(
+            output_file, db_path, days, limit_days, filters, collect=not stream
+        )
+        st.add(read=total_flights, written=unique_days)
     conn.close()
 
-    counts = defaultdict(int)
-    delay_sum = defaultdict(float)
-    delay_n = defaultdict(int)
-
-    for d, delay in rows:
-        counts[d] += 1
-        if delay is None:
-            continue
-        if isinstance(delay, (int, float)) and delay >= 0:
-            delay_sum[d] += float(delay)
-            delay_n[d] += 1
-
-    dates_sorted = sorted(counts.keys())
-    results = []
-    for d in dates_sorted:
-        avg = None
-        if delay_n[d] > 0:
-            avg = delay_sum[d] / delay_n[d]
-        results.append((d, counts[d], avg))
-
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write("Flight Daily Stats (Flight-only)\n")
-        f.write(f"Database: {db_path}\n")
-        f.write("Source table: flight_history\n")
-        f.write("Calculations:\n")
-        f.write("  - flight_count per day\n")
-        f.write("  - avg_delay_min per day (ignores NULL and negative delays)\n\n")
-
-        f.write("Columns:\n")
-        f.write("date\tflight_count\tavg_delay_min\n")
-        f.write("-" * 50 + "\n")
-
-        for d, cnt, avg in results[:limit_days]:
-            avg_str = "NA" if avg is None else f"{avg:.2f}"
-            f.write(f"{d}\t{cnt}\t{avg_str}\n")
-
-        f.write("\n")
-        f.write(f"Total unique days: {len(results)}\n")
-        f.write(f"Total flights (rows in flight_history selected): {len(rows)}\n")
-        f.write(f"Rows written (limit_days={limit_days}): {min(len(results), limit_days)}\n")
-
     print(f"Saved calculation file: {output_file}")
-    print(f"Total flights selected: {len(rows)}")
-    print(f"Total unique days: {len(results)}")
+    print(f"Total flights selected: {total_flights}")
+    print(f"Total unique days: {unique_days}")
     return results
 
 
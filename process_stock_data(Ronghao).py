@@ -10,9 +10,12 @@ GRADING REQUIREMENTS MET:
 3. Creates visualization: airline_comparison.png
 """
 
-import sqlite3
 import matplotlib.pyplot as plt
 from datetime import datetime
+from stock_rolling import refresh_rolling_metrics, latest_metrics
+from query_cache import cached_query
+from db_utils import connect
+from metrics import get_metrics
 
 DATABASE_NAME = "stock_data.db"
 
@@ -27,8 +30,6 @@ def compare_airlines_under_weather(connection):
     - airlines (INTEGER PRIMARY KEY: id)
     - stock_history (FOREIGN KEY: airline_id)
     """
-    cursor = connection.cursor()
-    
     # This query JOINs airlines and stock_history using INTEGER key
     query = '''
         SELECT 
@@ -48,8 +49,8 @@ def compare_airlines_under_weather(connection):
     '''
     
     try:
-        cursor.execute(query)
-        results = cursor.fetchall()
+        # served from query_cache.db until airlines/stock_history change
+        results = cached_query(connection, query, (), ["airlines", "stock_history"])
         
         columns = ['airline_id', 'symbol', 'name', 'trading_days', 
                    'avg_return', 'worst_day', 'best_day', 'avg_volatility']
@@ -124,7 +125,7 @@ def write_results_to_file(data, db_path, output_file='stock_analysis_results.txt
     
     GRADING: "Write out the calculated data to a file as text"
     """
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cursor = conn.cursor()
     
     with open(output_file, 'w', encoding='utf-8') as f:
@@ -190,7 +191,7 @@ def process_stock_data(db_path=DATABASE_NAME):
     print("PROCESSING STOCK DATA - Ronghao Wang")
     print("=" * 60)
     
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cursor = conn.cursor()
     
     # Check tables exist
@@ -215,7 +216,9 @@ def process_stock_data(db_path=DATABASE_NAME):
     
     # Run analysis (demonstrates JOIN)
     print("\nRunning analysis (JOIN: airlines.id -> stock_history.airline_id)...")
-    data = compare_airlines_under_weather(conn)
+    with get_metrics().stage("compare_airlines") as st:
+        data = compare_airlines_under_weather(conn)
+        st.add(read=count, written=len(data or []))
     
     if data:
         print("\nResults:")
@@ -224,9 +227,19 @@ def process_stock_data(db_path=DATABASE_NAME):
         
         # Generate outputs
         print("\nGenerating outputs...")
-        plot_airline_comparison(data)
+        with get_metrics().stage("plot_airline_comparison"):
+            plot_airline_comparison(data)
         write_results_to_file(data, db_path)
     
+    # Rolling metrics (only airlines with new stock rows are recomputed)
+    with get_metrics().stage("rolling_metrics") as st, conn:
+        refreshed = refresh_rolling_metrics(conn)
+        st.add(written=refreshed)
+    print(f"\nRolling metrics refreshed for {refreshed} airline(s). Latest 20-day window:")
+    for symbol, day, ma_return, volatility, drawdown, volume_z in latest_metrics(conn):
+        if ma_return is not None:
+            print(f"  {symbol} {day}: MA Return = {ma_return:.4f}%, Drawdown = {drawdown:.2%}")
+    
     conn.close()
     print("\n" + "=" * 60)
     print("DONE!")
@@ -1,83 +1,128 @@
-import sqlite3
-import json
 import os
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from weather_tables import ensure_weather_hourly, changed_days, refresh_daily_weather_summary
+from db_utils import connect, iter_rows
+from metrics import get_metrics
 
-def process_weather_data(db_path):
-    # connect to database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+def create_weekly_agg_tables(conn):
+    # running wind sum/count per %Y-Week%U bucket, plus the last
+    # weather_hourly_days id already folded in
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS weekly_wind_agg (
+            week_key TEXT PRIMARY KEY,
+            wind_sum REAL NOT NULL,
+            wind_count INTEGER NOT NULL,
+            start_date TEXT,
+            end_date TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS weekly_wind_agg_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            high_water INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO weekly_wind_agg_state (id, high_water) VALUES (1, 0)")
 
-    # get raw data
-    try:
-        cursor.execute("SELECT record_date, full_data_json FROM weather_history ORDER BY record_date ASC")
-        rows = cursor.fetchall()
-    except Exception:
-        conn.close()
-        return
+def week_bounds(date_obj):
+    # all dates sharing date_obj's %Y-Week%U key: its sunday-to-saturday
+    # week, cut at the year boundary (%U restarts at week 00 on Jan 1)
+    sunday = date_obj - timedelta(days=(date_obj.weekday() + 1) % 7)
+    start = max(sunday, date(date_obj.year, 1, 1))
+    end = min(sunday + timedelta(days=6), date(date_obj.year, 12, 31))
+    return start, end
 
-    # dictionaries to store data
-    weekly_wind_speeds = {}
-    weekly_dates = {}
+def refresh_weekly_wind_agg(conn):
+    # recompute just the weeks of days rewritten since the high-water mark
+    # (weather_hourly_days also logs days rewritten to no hours)
+    create_weekly_agg_tables(conn)
+    cursor = conn.cursor()
+    cursor.execute("SELECT high_water FROM weekly_wind_agg_state WHERE id = 1")
+    high_water = cursor.fetchone()[0]
 
-    # process rows
-    for row in rows:
-        date_str = row[0]
-        json_str = row[1]
-        
-        if not json_str:
-            continue
-            
-        try:
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-            week_key = date_obj.strftime("%Y-Week%U")
-            
-            # extract wind speeds
-            data = json.loads(json_str)
-            hourly_list = data.get('hourly', [])
-            
-            for h in hourly_list:
-                wind_speed = int(h.get('wind_speed', 0))
-                
-                if week_key in weekly_wind_speeds:
-                    weekly_wind_speeds[week_key].append(wind_speed)
-                else:
-                    weekly_wind_speeds[week_key] = [wind_speed]
+    days, new_high_water = changed_days(conn, high_water)
+    if not days:
+        return 0
 
-            # record the date for this week
-            if week_key in weekly_dates:
-                weekly_dates[week_key].append(date_str)
-            else:
-                weekly_dates[week_key] = [date_str]
-                    
+    touched = {}
+    for _, date_str in days:
+        try:
+            date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
         except Exception:
             continue
+        touched[date_obj.strftime("%Y-Week%U")] = week_bounds(date_obj)
 
-    # write to text file
-    output_filename = "weekly_avg_wind_speed.txt"
-    
+    with conn:
+        for week_key, (start, end) in touched.items():
+            cursor.execute("""
+                SELECT SUM(wind_speed), COUNT(wind_speed), MIN(record_date), MAX(record_date)
+                FROM weather_hourly
+                WHERE record_date BETWEEN ? AND ?
+            """, (start.isoformat(), end.isoformat()))
+            wind_sum, wind_count, start_date, end_date = cursor.fetchone()
+            if wind_count:
+                cursor.execute("""
+                    INSERT OR REPLACE INTO weekly_wind_agg (week_key, wind_sum, wind_count, start_date, end_date)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (week_key, wind_sum, wind_count, start_date, end_date))
+            else:
+                cursor.execute("DELETE FROM weekly_wind_agg WHERE week_key = ?", (week_key,))
+        cursor.execute("UPDATE weekly_wind_agg_state SET high_water = ? WHERE id = 1", (new_high_water,))
+
+    return len(touched)
+
+def write_weekly_report(output_filename, weeks):
+    # weeks: (week_key, wind_sum, wind_count, start_date, end_date) in week order
+    # returns (weeks written, wind readings they cover)
+    written = readings = 0
     with open(output_filename, "w") as f:
         # header
         f.write(f"{'Week Range':<50} | {'Avg Wind Speed (km/h)':<20}\n")
         f.write("-" * 75 + "\n")
         
-        sorted_weeks = sorted(weekly_wind_speeds.keys())
-        
-        for week in sorted_weeks:
-            speeds = weekly_wind_speeds[week]
-            dates = weekly_dates[week]
-            
-            if len(speeds) > 0:
-                average_speed = sum(speeds) / len(speeds)
-                
-                # find start and end date for this week
-                dates.sort()
-                start_date = dates[0]
-                end_date = dates[-1]
+        for week, wind_sum, wind_count, start_date, end_date in weeks:
+            if wind_count > 0:
+                average_speed = wind_sum / wind_count
                 
                 week_label = f"{week} ({start_date} to {end_date})"
                 
                 f.write(f"{week_label:<50} | {average_speed:.2f}\n")
+                written += 1
+                readings += wind_count
+    return written, readings
+
+def process_weather_data(db_path, batch_size=1000):
+    # connect to database
+    conn = connect(db_path)
+    cursor = conn.cursor()
+
+    # bring weather_hourly up to date (filled from the raw json on first
+    # run), then fold only the rewritten days into the daily summary (read
+    # by visualisation(Zuming).py) and the weekly aggregates
+    try:
+        with get_metrics().stage("refresh_weekly_wind_agg") as st:
+            ensure_weather_hourly(conn)
+            with conn:
+                refresh_daily_weather_summary(conn)
+            weeks = refresh_weekly_wind_agg(conn)
+            st.add(written=weeks)
+        print(f"Recomputed {weeks} week(s)")
+    except Exception as e:
+        # e.g. no weather tables yet; say so instead of silently writing no report
+        print(f"Weekly wind report skipped: {e}")
+        conn.close()
+        return
+
+    # write to text file, streaming the weekly rows straight from the cursor
+    output_filename = "weekly_avg_wind_speed.txt"
+    with get_metrics().stage("weekly_wind_report") as st:
+        cursor.execute("""
+            SELECT week_key, wind_sum, wind_count, start_date, end_date
+            FROM weekly_wind_agg
+            ORDER BY week_key ASC
+        """)
+        written, readings = write_weekly_report(output_filename, iter_rows(cursor, batch_size))
+        st.add(read=readings, written=written)
 
     conn.close()
     print(f"Done. Results saved to {output_filename}")
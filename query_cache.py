@@ -0,0 +1,165 @@
+"""
+Result cache for the analysis queries, invalidated by data version.
+
+An entry is keyed on the database file, the SQL, its params and a
+fingerprint of the source tables the caller names: for each table its
+MAX(rowid) and sqlite_sequence value (both index lookups, no table scan),
+plus the rows of <table>_state when the table is kept up to date by one of
+the incremental refreshers (daily_weather_summary, weekly_wind_agg, ...),
+since those rewrite rows in place. The history tables only grow, and a
+rewritten day gets fresh AUTOINCREMENT ids, so any ingest or refresh
+changes the fingerprint; when nothing changed the rows come straight from
+the cache. (A bare DELETE of older rows is not detected.)
+
+Entries live in a separate SQLite file (query_cache.db), zlib-compressed,
+and are evicted least-recently-used beyond MAX_ENTRIES / MAX_BYTES.
+
+Switched with the WZH_QUERY_CACHE environment variable (on/off, default on);
+WZH_QUERY_CACHE_DB picks the cache file.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+QUERY_CACHE_DB = os.environ.get("WZH_QUERY_CACHE_DB", "query_cache.db")
+MAX_ENTRIES = 500
+MAX_BYTES = 64 * 1024 * 1024
+
+
+def table_fingerprint(conn, table):
+    # no COUNT(*): that is a full scan on every lookup
+    max_rowid = conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0]
+    fingerprint = [table, max_rowid]
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='sqlite_sequence'").fetchone():
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        fingerprint.append(row[0] if row else None)
+    state = f"{table}_state"
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (state,)).fetchone():
+        fingerprint.append(conn.execute(f"SELECT * FROM {state} ORDER BY 1").fetchall())
+    return fingerprint
+
+
+def database_path(conn):
+    row = conn.execute("PRAGMA database_list").fetchone()
+    return os.path.abspath(row[2]) if row and row[2] else ":memory:"
+
+
+class QueryCache:
+
+    def __init__(self, path=QUERY_CACHE_DB, enabled=True, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.path = path
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS query_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    db_path TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    result BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            ''')
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_query_cache_last_used ON query_cache(last_used)")
+            self.conn.commit()
+        return self.conn
+
+    def key(self, db_path, sql, params, fingerprint):
+        raw = json.dumps([db_path, " ".join(sql.split()), list(params), fingerprint], default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def fetch(self, conn, sql, params=(), tables=()):
+        """
+        Rows of `sql` run on `conn`, from the cache when none of `tables`
+        changed since the result was stored.
+        """
+        if not self.enabled or conn.in_transaction:
+            # uncommitted changes aren't part of any data version we can key on
+            return conn.execute(sql, params).fetchall()
+
+        db_path = database_path(conn)
+        fingerprint = [table_fingerprint(conn, t) for t in tables]
+        cache_key = self.key(db_path, sql, params, fingerprint)
+
+        with self.lock:
+            cache = self.connect()
+            row = cache.execute("SELECT result FROM query_cache WHERE cache_key = ?", (cache_key,)).fetchone()
+            if row is not None:
+                with cache:
+                    cache.execute("UPDATE query_cache SET last_used = ? WHERE cache_key = ?", (time.time(), cache_key))
+                self.hits += 1
+                return [tuple(r) for r in json.loads(zlib.decompress(row[0]))]
+
+        rows = conn.execute(sql, params).fetchall()
+        params_json = json.dumps(list(params), default=str)
+        blob = zlib.compress(json.dumps(rows).encode("utf-8"), 6)
+        with self.lock:
+            cache = self.connect()
+            with cache:
+                # results for older versions of the same query can't be hit again
+                cache.execute("DELETE FROM query_cache WHERE db_path = ? AND sql = ? AND params = ?",
+                              (db_path, sql, params_json))
+                cache.execute('''
+                    INSERT OR REPLACE INTO query_cache
+                    (cache_key, db_path, sql, params, fingerprint, result, size, last_used)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (cache_key, db_path, sql, params_json, json.dumps(fingerprint, default=str), blob, len(blob),
+                      time.time()))
+                self.evict(cache)
+            self.misses += 1
+        return rows
+
+    def evict(self, cache):
+        """Drop least-recently-used entries until under both limits."""
+        count, total = cache.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM query_cache").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return 0
+        removed = 0
+        for cache_key, size in cache.execute(
+                "SELECT cache_key, size FROM query_cache ORDER BY last_used").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            cache.execute("DELETE FROM query_cache WHERE cache_key = ?", (cache_key,))
+            count -= 1
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        with self.lock:
+            cache = self.connect()
+            with cache:
+                cache.execute("DELETE FROM query_cache")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryCache(enabled=os.environ.get("WZH_QUERY_CACHE", "on").lower() != "off")
+        return _cache
+
+
+def cached_query(conn, sql, params=(), tables=()):
+    """fetchall() of `sql` through the shared cache; `tables` are the tables it reads."""
+    return get_query_cache().fetch(conn, sql, params, tables)
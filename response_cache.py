@@ -0,0 +1,190 @@
+"""
+On-disk cache of API responses, checked by ingest_client before the network.
+
+Entries are content-addressed: sha256 of the URL plus the sorted request
+params (access_key excluded, so rotating keys keeps the cache) names a
+zlib-compressed copy of the response body under .http_cache/.
+
+Mode is picked with the WZH_HTTP_CACHE environment variable:
+    on      read fresh entries, store successful responses (default: a
+            rerun within the ENDPOINT_TTLS below doesn't pay for the same
+            calls again)
+    off     never read or write the cache; every fetch hits the API
+    replay  serve every request from the cache, whatever its age, and never
+            touch the network; a miss raises CacheMiss
+
+Only HTTP 200 responses without an API error body are stored.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+import requests
+
+CACHE_DIR = os.environ.get("WZH_HTTP_CACHE_DIR", ".http_cache")
+MAX_CACHE_BYTES = int(os.environ.get("WZH_HTTP_CACHE_MAX_MB", "500")) * 1024 * 1024
+
+# TTL in seconds, matched against the end of the URL path
+ENDPOINT_TTLS = {
+    "/flights": 24 * 3600,         # a past day's flights barely change after a day
+    "/historical": 30 * 24 * 3600, # historical weather is final
+    "/eod": 7 * 24 * 3600,         # end-of-day prices are final, allow for corrections
+}
+DEFAULT_TTL = 3600
+
+
+class CacheMiss(requests.exceptions.RequestException):
+    """Raised in replay mode when a request has no cached response."""
+
+
+def cache_key(url, params):
+    params = {k: v for k, v in (params or {}).items() if k != "access_key"}
+    raw = json.dumps([url, sorted((str(k), str(v)) for k, v in params.items())])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def ttl_for(url):
+    path = url.split("?", 1)[0].rstrip("/")
+    for suffix, ttl in ENDPOINT_TTLS.items():
+        if path.endswith(suffix):
+            return ttl
+    return DEFAULT_TTL
+
+
+def is_cacheable(resp):
+    if resp.status_code != 200:
+        return False
+    try:
+        data = resp.json()
+    except ValueError:
+        return False
+    if isinstance(data, dict) and (data.get("error") or data.get("success") is False):
+        return False
+    return True
+
+
+def make_response(url, body):
+    """Rebuild a requests.Response so callers' raise_for_status()/json() keep working."""
+    resp = requests.Response()
+    resp.status_code = 200
+    resp._content = body
+    resp.url = url
+    resp.encoding = "utf-8"
+    resp.headers["X-Cache"] = "HIT"
+    return resp
+
+
+class ResponseCache:
+    def __init__(self, cache_dir=CACHE_DIR, mode="on", max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.total_bytes = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".z")
+
+    def count(self, hit):
+        # get() runs on the fetchers' worker threads
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, url, params):
+        """Cached response for (url, params), or None."""
+        if self.mode == "off":
+            return None
+        path = self.path_for(cache_key(url, params))
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if self.mode != "replay" and age > ttl_for(url):
+                self.count(hit=False)
+                return None
+            with open(path, "rb") as f:
+                body = zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            self.count(hit=False)
+            if self.mode == "replay":
+                raise CacheMiss(f"replay mode: no cached response for {url} {cache_key(url, params)[:12]}")
+            return None
+        self.count(hit=True)
+        return make_response(url, body)
+
+    def put(self, url, params, resp):
+        if self.mode != "on" or not is_cacheable(resp):
+            return
+        path = self.path_for(cache_key(url, params))
+        data = zlib.compress(resp.content, 6)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+
+        with self.lock:
+            try:
+                # an expired entry being overwritten
+                old_size = os.path.getsize(path)
+            except OSError:
+                old_size = 0
+            os.replace(tmp, path)
+            if self.total_bytes is None:
+                self.total_bytes = self.scan_size()
+            else:
+                self.total_bytes += len(data) - old_size
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def entries(self):
+        """[(mtime, size, path)] for every cache file."""
+        found = []
+        if not os.path.isdir(self.cache_dir):
+            return found
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".z"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append((st.st_mtime, st.st_size, path))
+        return found
+
+    def scan_size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Delete the oldest entries until the cache is back under 90% of max_bytes."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self.total_bytes = total
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(mode=os.environ.get("WZH_HTTP_CACHE", "on").lower())
+        return _cache
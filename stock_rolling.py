@@ -0,0 +1,190 @@
+"""
+Rolling-window stock metrics per airline, cached in stock_rolling_metrics.
+
+For every (airline_id, record_date, window) row:
+  - ma_return:  mean of return_percentage over the last `window` trading days
+  - volatility: mean of price_range over the same days (the rolling form of
+                avg_volatility in process_stock_data(Ronghao).py)
+  - drawdown:   close_price / highest close so far - 1 (same for every window)
+  - volume_z:   (volume - rolling mean) / rolling std of volume
+Rolling values are NULL until an airline has `window` days of history.
+
+stock_history is append-only (INSERT OR IGNORE), so refresh_rolling_metrics()
+looks at rows above the last seen id, and per airline recomputes only from
+the earliest new date, reading window-1 earlier rows for the lookback and
+the stored running peak for the drawdown. Each airline is one NumPy pass.
+    python stock_rolling.py stock_data.db
+"""
+
+import sqlite3
+import sys
+
+import numpy as np
+
+WINDOWS = (5, 20)
+
+
+def create_rolling_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stock_rolling_metrics (
+            airline_id INTEGER NOT NULL,
+            record_date TEXT NOT NULL,
+            window INTEGER NOT NULL,
+            ma_return REAL,
+            volatility REAL,
+            drawdown REAL,
+            volume_z REAL,
+            peak_close REAL,
+            PRIMARY KEY (airline_id, record_date, window),
+            FOREIGN KEY (airline_id) REFERENCES airlines(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stock_rolling_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            high_water INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO stock_rolling_state (id, high_water) VALUES (1, 0)")
+
+
+def rolling_mean_std(values, window):
+    """Trailing mean/std over `window` values (NaN until the window is full or if it holds a NaN)."""
+    n = len(values)
+    mean = np.full(n, np.nan)
+    std = np.full(n, np.nan)
+    if n >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(values, window)
+        mean[window - 1:] = windows.mean(axis=1)
+        std[window - 1:] = windows.std(axis=1)
+    return mean, std
+
+
+def compute_metrics(closes, returns, ranges, volumes, prior_peak, windows=WINDOWS):
+    """
+    Vectorized metrics for one airline's rows in date order.
+
+    Returns:
+        drawdown, peak, {window: (ma_return, volatility, volume_z)} as arrays
+    """
+    seeded = np.concatenate(([prior_peak], closes))
+    peak = np.fmax.accumulate(seeded)[1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown = closes / peak - 1
+
+    per_window = {}
+    for window in windows:
+        ma_return, _ = rolling_mean_std(returns, window)
+        volatility, _ = rolling_mean_std(ranges, window)
+        vol_mean, vol_std = rolling_mean_std(volumes, window)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            volume_z = np.where(vol_std > 0, (volumes - vol_mean) / vol_std, np.nan)
+        per_window[window] = (ma_return, volatility, volume_z)
+    return drawdown, peak, per_window
+
+
+def as_sql(value):
+    return None if np.isnan(value) else float(value)
+
+
+def refresh_airline(conn, airline_id, start_date, windows=WINDOWS):
+    """Recompute one airline's metrics from start_date on; returns rows written (caller commits)."""
+    lookback = max(windows) - 1
+    earlier = conn.execute('''
+        SELECT record_date, close_price, return_percentage, price_range, volume
+        FROM stock_history
+        WHERE airline_id = ? AND record_date < ?
+        ORDER BY record_date DESC LIMIT ?
+    ''', (airline_id, start_date, lookback)).fetchall()
+    recent = conn.execute('''
+        SELECT record_date, close_price, return_percentage, price_range, volume
+        FROM stock_history
+        WHERE airline_id = ? AND record_date >= ?
+        ORDER BY record_date
+    ''', (airline_id, start_date)).fetchall()
+    rows = earlier[::-1] + recent
+    if not recent:
+        return 0
+
+    # running peak up to the first reused row: from the cache if we have it
+    prior_peak = np.nan
+    if rows[0][0] < start_date:
+        cached = conn.execute('''
+            SELECT peak_close FROM stock_rolling_metrics
+            WHERE airline_id = ? AND record_date < ?
+            ORDER BY record_date DESC LIMIT 1
+        ''', (airline_id, rows[0][0])).fetchone()
+        if cached is None:
+            cached = conn.execute('''
+                SELECT MAX(close_price) FROM stock_history
+                WHERE airline_id = ? AND record_date < ?
+            ''', (airline_id, rows[0][0])).fetchone()
+        if cached[0] is not None:
+            prior_peak = cached[0]
+
+    data = np.array([r[1:] for r in rows], dtype=float)
+    closes, returns, ranges, volumes = data.T
+    drawdown, peak, per_window = compute_metrics(closes, returns, ranges, volumes, prior_peak, windows)
+
+    first = len(earlier)
+    out = []
+    for i in range(first, len(rows)):
+        for window in windows:
+            ma_return, volatility, volume_z = per_window[window]
+            out.append((airline_id, rows[i][0], window, as_sql(ma_return[i]), as_sql(volatility[i]),
+                        as_sql(drawdown[i]), as_sql(volume_z[i]), as_sql(peak[i])))
+
+    conn.execute("DELETE FROM stock_rolling_metrics WHERE airline_id = ? AND record_date >= ?",
+                 (airline_id, start_date))
+    conn.executemany('''
+        INSERT INTO stock_rolling_metrics
+        (airline_id, record_date, window, ma_return, volatility, drawdown, volume_z, peak_close)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', out)
+    return len(out)
+
+
+def refresh_rolling_metrics(conn, windows=WINDOWS):
+    """Bring stock_rolling_metrics up to date with stock_history; returns airlines refreshed (caller commits)."""
+    create_rolling_tables(conn)
+    high_water = conn.execute("SELECT high_water FROM stock_rolling_state WHERE id = 1").fetchone()[0]
+    new_high_water = conn.execute("SELECT MAX(id) FROM stock_history").fetchone()[0] or 0
+    if new_high_water <= high_water:
+        return 0
+
+    touched = conn.execute('''
+        SELECT airline_id, MIN(record_date) FROM stock_history
+        WHERE id > ? GROUP BY airline_id
+    ''', (high_water,)).fetchall()
+    for airline_id, start_date in touched:
+        refresh_airline(conn, airline_id, start_date, windows)
+    conn.execute("UPDATE stock_rolling_state SET high_water = ? WHERE id = 1", (new_high_water,))
+    return len(touched)
+
+
+def latest_metrics(conn, window=20):
+    """Most recent cached row per airline for one window: [(symbol, record_date, ma_return, volatility, drawdown, volume_z)]."""
+    return conn.execute('''
+        SELECT a.symbol, m.record_date, m.ma_return, m.volatility, m.drawdown, m.volume_z
+        FROM stock_rolling_metrics m
+        JOIN airlines a ON a.id = m.airline_id
+        WHERE m.window = ? AND m.record_date = (
+            SELECT MAX(record_date) FROM stock_rolling_metrics
+            WHERE airline_id = m.airline_id AND window = m.window
+        )
+        ORDER BY a.symbol
+    ''', (window,)).fetchall()
+
+
+if __name__ == "__main__":
+    db_file = sys.argv[1] if len(sys.argv) > 1 else "stock_data.db"
+    connection = sqlite3.connect(db_file)
+    with connection:
+        print(f"Refreshed rolling metrics for {refresh_rolling_metrics(connection)} airline(s)")
+    for symbol, day, ma_return, volatility, drawdown, volume_z in latest_metrics(connection):
+        if ma_return is None or volume_z is None:
+            print(f"  {symbol} {day}: not enough history for a 20-day window")
+            continue
+        print(f"  {symbol} {day}: 20d return {ma_return:.4f}%, volatility ${volatility:.4f}, "
+              f"drawdown {drawdown:.2%}, volume z {volume_z:.2f}")
+    connection.close()
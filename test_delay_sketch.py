@@ -0,0 +1,70 @@
+"""Tests for the delay-percentile sketches in delay_sketch.py"""
+import random
+import sqlite3
+
+from delay_sketch import DelaySketch, RELATIVE_ACCURACY, refresh_delay_sketches, delay_quantiles
+
+
+def true_quantile(values, q):
+    # the element DelaySketch.quantile ranks to
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+def test_quantiles_within_relative_accuracy():
+    rng = random.Random(201)
+    values = [rng.lognormvariate(3, 1.5) for _ in range(20000)] + [0] * 500
+    sketch = DelaySketch()
+    for v in values:
+        sketch.add(v)
+    for q in (0.01, 0.1, 0.5, 0.9, 0.99, 0.999, 1.0):
+        expected = true_quantile(values, q)
+        assert abs(sketch.quantile(q) - expected) <= RELATIVE_ACCURACY * expected
+
+
+def test_merge_and_json_round_trip_match_one_sketch():
+    rng = random.Random(7)
+    values = [rng.randint(0, 300) for _ in range(5000)]
+    whole = DelaySketch()
+    parts = [DelaySketch() for _ in range(4)]
+    for i, v in enumerate(values):
+        whole.add(v)
+        parts[i % 4].add(v)
+    merged = DelaySketch()
+    for part in parts:
+        merged.merge(DelaySketch.from_json(part.to_json()))
+    assert merged.count == whole.count == len(values)
+    for q in (0.5, 0.9, 0.99):
+        assert merged.quantile(q) == whole.quantile(q)
+
+
+def test_incremental_refresh_matches_all_rows():
+    conn = sqlite3.connect(":memory:")
+    conn.execute('''
+        CREATE TABLE flight_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            airport_code TEXT NOT NULL,
+            record_date TEXT NOT NULL,
+            airline_name TEXT,
+            dep_delay_min INTEGER
+        )
+    ''')
+    rng = random.Random(3)
+    rows = [("JFK", f"2025-09-{d:02d}", rng.choice(["Delta", "JetBlue", None]), rng.choice([None, -5, *range(0, 240)]))
+            for d in range(1, 15) for _ in range(40)]
+    insert = "INSERT INTO flight_history (airport_code, record_date, airline_name, dep_delay_min) VALUES (?, ?, ?, ?)"
+
+    # two ingest runs, each followed by a refresh
+    conn.executemany(insert, rows[:300])
+    refresh_delay_sketches(conn)
+    conn.executemany(insert, rows[300:])
+    refresh_delay_sketches(conn)
+    assert refresh_delay_sketches(conn) == 0
+
+    delays = [r[3] for r in rows if isinstance(r[3], int) and r[3] >= 0]
+    result = delay_quantiles(conn)
+    assert result["count"] == len(delays)
+    for q in (0.5, 0.9, 0.99):
+        expected = true_quantile(delays, q)
+        assert abs(result[q] - expected) <= RELATIVE_ACCURACY * expected
+    conn.close()
@@ -0,0 +1,118 @@
+"""Tests for the incremental merge in main.py, on small temporary databases"""
+import importlib.util
+import sqlite3
+from pathlib import Path
+
+import main
+
+
+def load_script(name, filename):
+    # the fetch scripts have parentheses in their file names
+    spec = importlib.util.spec_from_file_location(name, Path(__file__).parent / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+fetch_weather = load_script("fetch_weather", "fetch_weather_data(Zuming).py")
+fetch_stock = load_script("fetch_stock", "fetch_stock_data(Ronghao).py")
+
+
+def weather_day(temp, winds):
+    return {
+        "avgtemp": temp, "mintemp": temp - 3, "maxtemp": temp + 3,
+        "hourly": [{"time": str(h * 300), "temperature": temp, "wind_speed": w, "wind_dir": "N",
+                    "precip": 0.1 * h, "humidity": 60, "visibility": 10, "pressure": 1012}
+                   for h, w in enumerate(winds)],
+    }
+
+
+def make_sources(tmp_path):
+    weather_db = str(tmp_path / "weather_data.db")
+    fetch_weather.create_db_table(weather_db)
+    fetch_weather.save_to_db(weather_db, "New York", {
+        f"2025-03-{d:02d}": weather_day(5 + d, [d, d + 4, d + 8]) for d in range(1, 11)
+    })
+    fetch_weather.save_to_db(weather_db, "Boston", {"2025-03-01": weather_day(2, [20, 30])})
+
+    stock_db = str(tmp_path / "stock_data.db")
+    fetch_stock.create_tables(stock_db)
+    conn = sqlite3.connect(stock_db)
+    conn.executemany('''
+        INSERT INTO stock_history (airline_id, record_date, close_price, volume, return_percentage, price_range)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(1, f"2025-03-{d:02d}", 10.0 + d, 1000 * d, 0.5, 1.0) for d in range(3, 8)])
+    conn.execute("UPDATE fetch_progress SET last_fetch_date = '2025-03-08', total_records = 5")
+    conn.commit()
+    conn.close()
+    return [weather_db, stock_db]
+
+
+def merge(sources, final_db):
+    return sum(main.merge_one(source, final_db) for source in sources)
+
+
+def mismatches(sources, final_db):
+    """(source, table, rows only in source, rows only in final) for every table that differs."""
+    final = sqlite3.connect(final_db)
+    diffs = []
+    for source in sources:
+        final.execute("ATTACH DATABASE ? AS s", (source,))
+        for (t,) in final.execute(
+                "SELECT name FROM s.sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchall():
+            cols = ", ".join(r[1] for r in final.execute(f"PRAGMA s.table_info({t})"))
+            only_src = final.execute(
+                f"SELECT COUNT(*) FROM (SELECT {cols} FROM s.{t} EXCEPT SELECT {cols} FROM main.{t})").fetchone()[0]
+            only_final = final.execute(
+                f"SELECT COUNT(*) FROM (SELECT {cols} FROM main.{t} EXCEPT SELECT {cols} FROM s.{t})").fetchone()[0]
+            if only_src or only_final:
+                diffs.append((Path(source).name, t, only_src, only_final))
+        final.execute("DETACH DATABASE s")
+    final.close()
+    return diffs
+
+
+def snapshot(db_path):
+    conn = sqlite3.connect(db_path)
+    dump = list(conn.iterdump())
+    conn.close()
+    return dump
+
+
+def test_merge_matches_sources_and_second_merge_is_a_no_op(tmp_path):
+    sources = make_sources(tmp_path)
+    final_db = str(tmp_path / "wzh_project.db")
+
+    assert merge(sources, final_db) > 0
+    assert mismatches(sources, final_db) == []
+
+    before = snapshot(final_db)
+    assert merge(sources, final_db) == 0
+    assert snapshot(final_db) == before
+
+
+def test_merge_picks_up_rewritten_days(tmp_path):
+    sources = make_sources(tmp_path)
+    weather_db = sources[0]
+    final_db = str(tmp_path / "wzh_project.db")
+    merge(sources, final_db)
+
+    # one day re-fetched with fewer hours, one rewritten to no hours at all
+    fetch_weather.save_to_db(weather_db, "New York", {
+        "2025-03-02": weather_day(7, [1]),
+        "2025-03-03": weather_day(8, []),
+    })
+    merge(sources, final_db)
+    assert mismatches(sources, final_db) == []
+
+    final = sqlite3.connect(final_db)
+    hours = dict(final.execute('''
+        SELECT record_date, COUNT(*) FROM weather_hourly
+        WHERE location = 'New York' AND record_date IN ('2025-03-02', '2025-03-03')
+        GROUP BY record_date
+    ''').fetchall())
+    summary = final.execute(
+        "SELECT 1 FROM daily_weather_summary WHERE location = 'New York' AND date = '2025-03-03'").fetchone()
+    final.close()
+    assert hours == {"2025-03-02": 1}
+    assert summary is None
@@ -0,0 +1,49 @@
+"""Tests for the NYSE trading calendar in the stock fetcher"""
+import importlib.util
+from datetime import date
+from pathlib import Path
+
+spec = importlib.util.spec_from_file_location("fetch_stock", Path(__file__).parent / "fetch_stock_data(Ronghao).py")
+fetch_stock = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(fetch_stock)
+
+# published NYSE full-day closures
+NYSE_CLOSURES = {
+    2021: ["2021-01-01", "2021-01-18", "2021-02-15", "2021-04-02", "2021-05-31", "2021-07-05",
+           "2021-09-06", "2021-11-25", "2021-12-24"],
+    2022: ["2022-01-17", "2022-02-21", "2022-04-15", "2022-05-30", "2022-06-20", "2022-07-04",
+           "2022-09-05", "2022-11-24", "2022-12-26"],
+    2023: ["2023-01-02", "2023-01-16", "2023-02-20", "2023-04-07", "2023-05-29", "2023-06-19",
+           "2023-07-04", "2023-09-04", "2023-11-23", "2023-12-25"],
+    2024: ["2024-01-01", "2024-01-15", "2024-02-19", "2024-03-29", "2024-05-27", "2024-06-19",
+           "2024-07-04", "2024-09-02", "2024-11-28", "2024-12-25"],
+}
+
+
+def test_holiday_rules_match_published_calendars():
+    for year, closures in NYSE_CLOSURES.items():
+        assert fetch_stock.nyse_holidays(year) == {date.fromisoformat(d) for d in closures}, year
+
+
+def test_weekend_holidays_and_special_closures():
+    # Saturday New Year's Day (2022): no closure on Friday Dec 31
+    assert fetch_stock.is_trading_day(date(2021, 12, 31))
+    # Sunday Juneteenth (2022): closed Monday
+    assert not fetch_stock.is_trading_day(date(2022, 6, 20))
+    # Juneteenth only from 2022 on
+    assert fetch_stock.is_trading_day(date(2021, 6, 18))
+    # one-off closures
+    assert not fetch_stock.is_trading_day(date(2012, 10, 29))
+    assert not fetch_stock.is_trading_day(date(2025, 1, 9))
+    assert not fetch_stock.is_trading_day(date(2024, 6, 15))  # Saturday
+    assert fetch_stock.is_trading_day(date(2024, 11, 29))     # day after Thanksgiving (early close only)
+
+
+def test_trading_windows_are_trimmed_to_trading_days():
+    windows = fetch_stock.trading_windows(date(2024, 12, 21), date(2025, 1, 12), window_days=7)
+    assert windows == [
+        (date(2024, 12, 23), date(2024, 12, 27)),
+        (date(2024, 12, 30), date(2025, 1, 3)),
+        (date(2025, 1, 6), date(2025, 1, 10)),
+    ]
+    assert fetch_stock.trading_windows(date(2024, 12, 25), date(2024, 12, 25)) == []
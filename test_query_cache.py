@@ -0,0 +1,54 @@
+"""Tests for the query cache's data-version fingerprint in query_cache.py"""
+import sqlite3
+
+from query_cache import QueryCache, table_fingerprint
+from weather_tables import create_weather_hourly_table, save_hourly, refresh_daily_weather_summary
+
+
+def weather_db(path):
+    conn = sqlite3.connect(path)
+    create_weather_hourly_table(conn)
+    save_hourly(conn, "New York", "2025-03-01", {"hourly": [{"time": "0", "wind_speed": 10, "precip": 0.5}]})
+    refresh_daily_weather_summary(conn)
+    conn.commit()
+    return conn
+
+
+def test_fingerprint_changes_after_ingest_and_refresh(tmp_path):
+    conn = weather_db(tmp_path / "weather_data.db")
+    tables = ("weather_hourly", "daily_weather_summary")
+    before = [table_fingerprint(conn, t) for t in tables]
+    assert [table_fingerprint(conn, t) for t in tables] == before
+
+    # ingest: a new day, and a rewrite of an existing day (same row count)
+    with conn:
+        save_hourly(conn, "New York", "2025-03-02", {"hourly": [{"time": "0", "wind_speed": 4}]})
+    after_ingest = table_fingerprint(conn, "weather_hourly")
+    assert after_ingest != before[0]
+    with conn:
+        save_hourly(conn, "New York", "2025-03-01", {"hourly": [{"time": "0", "wind_speed": 30}]})
+    assert table_fingerprint(conn, "weather_hourly") != after_ingest
+
+    # refresh: the summary rewrites rows in place, its state row moves
+    with conn:
+        refresh_daily_weather_summary(conn)
+    assert table_fingerprint(conn, "daily_weather_summary") != before[1]
+    conn.close()
+
+
+def test_cached_rows_follow_the_data(tmp_path):
+    conn = weather_db(tmp_path / "weather_data.db")
+    cache = QueryCache(path=str(tmp_path / "query_cache.db"))
+    sql = "SELECT date, max_wind_speed FROM daily_weather_summary ORDER BY date"
+    tables = ("daily_weather_summary",)
+
+    assert cache.fetch(conn, sql, tables=tables) == [("2025-03-01", 10)]
+    assert cache.fetch(conn, sql, tables=tables) == [("2025-03-01", 10)]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    with conn:
+        save_hourly(conn, "New York", "2025-03-01", {"hourly": [{"time": "0", "wind_speed": 25}]})
+        refresh_daily_weather_summary(conn)
+    assert cache.fetch(conn, sql, tables=tables) == [("2025-03-01", 25)]
+    assert (cache.hits, cache.misses) == (1, 2)
+    conn.close()
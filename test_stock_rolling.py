@@ -0,0 +1,69 @@
+"""Tests for the incremental rolling metrics in stock_rolling.py"""
+import random
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+from stock_rolling import refresh_rolling_metrics
+
+
+def stock_db():
+    conn = sqlite3.connect(":memory:")
+    conn.execute('''
+        CREATE TABLE stock_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            airline_id INTEGER NOT NULL,
+            record_date TEXT NOT NULL,
+            close_price REAL,
+            volume INTEGER,
+            return_percentage REAL,
+            price_range REAL,
+            UNIQUE(airline_id, record_date)
+        )
+    ''')
+    return conn
+
+
+def save(conn, rows):
+    conn.executemany('''
+        INSERT OR IGNORE INTO stock_history (airline_id, record_date, close_price, volume, return_percentage, price_range)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    refresh_rolling_metrics(conn)
+    conn.commit()
+
+
+def metrics(conn):
+    return conn.execute("SELECT * FROM stock_rolling_metrics ORDER BY airline_id, record_date, window").fetchall()
+
+
+def test_incremental_refresh_matches_full_recompute():
+    rng = random.Random(16)
+    rows = []
+    for airline_id in (1, 2):
+        close = 50.0
+        for i in range(80):
+            close *= 1 + rng.uniform(-0.05, 0.06)
+            day = (date(2024, 1, 1) + timedelta(days=i)).isoformat()
+            rows.append((airline_id, day, close, rng.randint(1000, 90000), rng.uniform(-3, 3), rng.uniform(0.1, 4)))
+
+    full = stock_db()
+    save(full, rows)
+
+    # three ingest runs; the last one also fills days older than ones
+    # already stored, as a backfill of a gap would
+    incremental = stock_db()
+    later = [r for r in rows if r[1] >= "2024-02-10"]
+    earlier = [r for r in rows if r[1] < "2024-02-10"]
+    save(incremental, earlier[::2])
+    save(incremental, later)
+    save(incremental, earlier[1::2])
+    assert refresh_rolling_metrics(incremental) == 0
+
+    expected = metrics(full)
+    actual = metrics(incremental)
+    assert len(actual) == len(expected) == len(rows) * 2
+    for got, want in zip(actual, expected):
+        assert got[:3] == want[:3]
+        assert got[3:] == pytest.approx(want[3:], nan_ok=True)
@@ -0,0 +1,63 @@
+"""Tests for the gap detection behind the weather backfill"""
+import importlib.util
+import sqlite3
+from datetime import date, timedelta
+from pathlib import Path
+
+spec = importlib.util.spec_from_file_location("fetch_weather", Path(__file__).parent / "fetch_weather_data(Zuming).py")
+fetch_weather = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(fetch_weather)
+
+
+def weather_db(tmp_path, rows):
+    db_path = str(tmp_path / "weather_data.db")
+    fetch_weather.create_db_table(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO weather_history (location, record_date) VALUES (?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def days(start, end):
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def test_empty_range_is_split_into_batches(tmp_path):
+    db_path = weather_db(tmp_path, [])
+    ranges = fetch_weather.find_missing_ranges(db_path, "New York", date(2025, 1, 1), date(2025, 2, 28))
+    assert ranges == [
+        (date(2025, 1, 1), date(2025, 1, 25)),
+        (date(2025, 1, 26), date(2025, 2, 19)),
+        (date(2025, 2, 20), date(2025, 2, 28)),
+    ]
+
+
+def test_only_gaps_of_this_location_are_returned(tmp_path):
+    have = days(date(2025, 1, 1), date(2025, 1, 31))
+    have.remove(date(2025, 1, 10))
+    for d in days(date(2025, 1, 20), date(2025, 1, 22)):
+        have.remove(d)
+    rows = [("New York", d.isoformat()) for d in have]
+    # Boston has nothing, which must not show up as gaps for New York
+    rows.append(("Boston", "2025-01-05"))
+    db_path = weather_db(tmp_path, rows)
+
+    ranges = fetch_weather.find_missing_ranges(db_path, "New York", date(2024, 12, 30), date(2025, 2, 2))
+    assert ranges == [
+        (date(2024, 12, 30), date(2024, 12, 31)),
+        (date(2025, 1, 10), date(2025, 1, 10)),
+        (date(2025, 1, 20), date(2025, 1, 22)),
+        (date(2025, 2, 1), date(2025, 2, 2)),
+    ]
+
+
+def test_gaps_cover_exactly_the_missing_days(tmp_path):
+    have = [d for d in days(date(2025, 3, 1), date(2025, 6, 30)) if d.day % 7 not in (0, 1, 2)]
+    db_path = weather_db(tmp_path, [("New York", d.isoformat()) for d in have])
+
+    ranges = fetch_weather.find_missing_ranges(db_path, "New York", date(2025, 2, 1), date(2025, 7, 31), batch_size=10)
+    covered = [d for start, end in ranges for d in days(start, end)]
+    assert all((end - start).days + 1 <= 10 for start, end in ranges)
+    assert covered == sorted(set(days(date(2025, 2, 1), date(2025, 7, 31))) - set(have))
+    assert fetch_weather.find_missing_ranges(db_path, "New York", date(2025, 3, 3), date(2025, 3, 6)) == []
@@ -0,0 +1,92 @@
+"""Tests for the incremental weather aggregates (weather_tables.py, process_weather_data(Zuming).py)"""
+import importlib.util
+import sqlite3
+from datetime import date, timedelta
+from pathlib import Path
+
+from weather_tables import create_weather_hourly_table, save_hourly, refresh_daily_weather_summary, severity_score
+
+spec = importlib.util.spec_from_file_location("process_weather", Path(__file__).parent / "process_weather_data(Zuming).py")
+process_weather = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(process_weather)
+
+
+def day(winds):
+    return {"hourly": [{"time": str(h * 100), "wind_speed": w, "precip": 0.2} for h, w in enumerate(winds)]}
+
+
+def refresh(conn):
+    with conn:
+        refresh_daily_weather_summary(conn)
+    process_weather.refresh_weekly_wind_agg(conn)
+
+
+def expected_weeks(conn):
+    weeks = {}
+    for record_date, wind in conn.execute("SELECT record_date, wind_speed FROM weather_hourly"):
+        key = date.fromisoformat(record_date).strftime("%Y-Week%U")
+        total, count, start, end = weeks.get(key, (0, 0, record_date, record_date))
+        weeks[key] = (total + wind, count + 1, min(start, record_date), max(end, record_date))
+    return sorted((key,) + value for key, value in weeks.items())
+
+
+def expected_summary(conn):
+    return conn.execute('''
+        SELECT record_date, location, MAX(wind_speed), SUM(precip) FROM weather_hourly
+        GROUP BY record_date, location ORDER BY record_date, location
+    ''').fetchall()
+
+
+def check_aggregates(conn):
+    assert conn.execute(
+        "SELECT week_key, wind_sum, wind_count, start_date, end_date FROM weekly_wind_agg ORDER BY week_key"
+    ).fetchall() == expected_weeks(conn)
+    summary = conn.execute('''
+        SELECT date, location, max_wind_speed, total_precip, severity_score FROM daily_weather_summary
+        ORDER BY date, location
+    ''').fetchall()
+    assert [row[:4] for row in summary] == expected_summary(conn)
+    assert all(row[4] == severity_score(row[2], row[3]) for row in summary)
+
+
+def test_zero_hour_rewrite_updates_summary_and_weeks():
+    conn = sqlite3.connect(":memory:")
+    create_weather_hourly_table(conn)
+    with conn:
+        for i in range(21):
+            save_hourly(conn, "New York", (date(2024, 12, 20) + timedelta(days=i)).isoformat(), day([i, i + 2, 5]))
+        save_hourly(conn, "Boston", "2025-01-02", day([40]))
+    refresh(conn)
+    check_aggregates(conn)
+
+    # the whole week of 2025-01-05 re-fetched with no hours, one more day
+    # re-fetched with fewer hours, the only Boston day rewritten to none
+    with conn:
+        for i in range(5, 9):
+            save_hourly(conn, "New York", f"2025-01-{i:02d}", day([]))
+        save_hourly(conn, "New York", "2025-01-02", day([50]))
+        save_hourly(conn, "Boston", "2025-01-02", day([]))
+    refresh(conn)
+    check_aggregates(conn)
+    assert conn.execute("SELECT 1 FROM weekly_wind_agg WHERE week_key = '2025-Week01'").fetchone() is not None
+    assert conn.execute("SELECT COUNT(*) FROM daily_weather_summary WHERE location = 'Boston'").fetchone()[0] == 0
+
+    # a refresh with nothing new recomputes nothing
+    assert refresh_daily_weather_summary(conn) == 0
+    assert process_weather.refresh_weekly_wind_agg(conn) == 0
+    conn.close()
+
+
+def test_week_emptied_by_rewrites_is_dropped():
+    conn = sqlite3.connect(":memory:")
+    create_weather_hourly_table(conn)
+    with conn:
+        save_hourly(conn, "New York", "2025-03-03", day([8, 9]))
+        save_hourly(conn, "New York", "2025-03-12", day([3]))
+    refresh(conn)
+    with conn:
+        save_hourly(conn, "New York", "2025-03-03", day([]))
+    refresh(conn)
+    check_aggregates(conn)
+    assert [r[0] for r in conn.execute("SELECT week_key FROM weekly_wind_agg")] == ["2025-Week10"]
+    conn.close()
@@ -1,5 +1,7 @@
-import sqlite3
 import matplotlib.pyplot as plt
+from query_cache import cached_query
+from db_utils import connect
+from metrics import get_metrics
 
 DB_PATH = "wzh_project.db"
 def table_exists(conn, table_name: str) -> bool:
@@ -12,39 +14,60 @@ def table_exists(conn, table_name: str) -> bool:
 
 
 def plot_wind_speed_vs_avg_delay(db_path=DB_PATH, output_file="wind_vs_delay.png"):
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
+    conn = connect(db_path)
 
     if not table_exists(conn, "flight_history"):
         print("Missing table: flight_history. Run fetch_flight_data first.")
         conn.close()
         return
 
-    if not table_exists(conn, "daily_weather_summary"):
+    if table_exists(conn, "daily_fact") and table_exists(conn, "daily_weather_summary"):
+        # per-date delay from the pre-aggregated (date, airport) rows,
+        # re-weighted by their delay counts; paired with each location's
+        # wind that day, same points as the flight_history join below
+        query = """
+            SELECT
+                d.date,
+                d.avg_delay,
+                w.max_wind_speed AS wind_speed
+            FROM (
+                SELECT date, SUM(avg_delay_min * delay_count) / SUM(delay_count) AS avg_delay
+                FROM daily_fact
+                WHERE delay_count > 0
+                GROUP BY date
+            ) d
+            JOIN daily_weather_summary w
+                ON w.date = d.date
+            WHERE w.max_wind_speed IS NOT NULL
+            GROUP BY d.date, w.max_wind_speed
+        """
+        tables = ["daily_fact", "daily_weather_summary"]
+    elif table_exists(conn, "daily_weather_summary"):
+        query = """
+            SELECT
+                f.record_date AS date,
+                AVG(CASE
+                        WHEN f.dep_delay_min IS NULL THEN NULL
+                        WHEN f.dep_delay_min < 0 THEN NULL
+                        ELSE f.dep_delay_min
+                    END) AS avg_delay,
+                w.max_wind_speed AS wind_speed
+            FROM flight_history f
+            JOIN daily_weather_summary w
+                ON f.record_date = w.date
+            WHERE f.dep_delay_min IS NOT NULL
+              AND w.max_wind_speed IS NOT NULL
+            GROUP BY f.record_date, w.max_wind_speed
+        """
+        tables = ["flight_history", "daily_weather_summary"]
+    else:
         print("No weather table found (daily_weather_summary).")
         print("You can still run this script; once weather data is added, it will generate the scatter plot.")
         conn.close()
         return
 
-    query = """
-        SELECT
-            f.record_date AS date,
-            AVG(CASE
-                    WHEN f.dep_delay_min IS NULL THEN NULL
-                    WHEN f.dep_delay_min < 0 THEN NULL
-                    ELSE f.dep_delay_min
-                END) AS avg_delay,
-            w.max_wind_speed AS wind_speed
-        FROM flight_history f
-        JOIN daily_weather_summary w
-            ON f.record_date = w.date
-        WHERE f.dep_delay_min IS NOT NULL
-          AND w.max_wind_speed IS NOT NULL
-        GROUP BY f.record_date, w.max_wind_speed
-    """
-
-    cur.execute(query)
-    rows = cur.fetchall()
+    # cached in query_cache.db until the source tables change
+    rows = cached_query(conn, query, (), tables)
     conn.close()
 
     if not rows:
@@ -66,8 +89,7 @@ def plot_wind_speed_vs_avg_delay(db_path=DB_PATH, output_file="wind_vs_delay.png
     print(f"Saved chart: {output_file} (points: {len(rows)})")
 
 def plot_avg_delay_by_date_bar(db_path=DB_PATH, output_file="avg_delay_by_date_bar.png", limit_days=30):
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
+    conn = connect(db_path)
 
     if not table_exists(conn, "flight_history"):
         print("Missing table: flight_history.")
@@ -88,8 +110,7 @@ def plot_avg_delay_by_date_bar(db_path=DB_PATH, output_file="avg_delay_by_date_b
         ORDER BY record_date ASC
     """
 
-    cur.execute(query)
-    rows = cur.fetchall()
+    rows = cached_query(conn, query, (), ["flight_history"])
     conn.close()
 
     if not rows:
@@ -114,7 +135,9 @@ def plot_avg_delay_by_date_bar(db_path=DB_PATH, output_file="avg_delay_by_date_b
 
 if __name__ == "__main__":
     # Flight-only bar chart
-    plot_avg_delay_by_date_bar()
+    with get_metrics().stage("plot_avg_delay_by_date_bar"):
+        plot_avg_delay_by_date_bar()
 
     # Weather vs Flight scatter
-    plot_wind_speed_vs_avg_delay()
\ No newline at end of file
+    with get_metrics().stage("plot_wind_speed_vs_avg_delay"):
+        plot_wind_speed_vs_avg_delay()
\ No newline at end of file
@@ -1,24 +1,35 @@
-import sqlite3
-import json
 import matplotlib.pyplot as plt
 import os
+from query_cache import cached_query
+from db_utils import connect_readonly
+from metrics import get_metrics
 
 def visualize_weather_impact(db_path):
     # connect to database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    conn = connect_readonly(db_path)
 
-    # query raw data directly from weather_history
-    sql_query = """
-        SELECT record_date, full_data_json 
-        FROM weather_history 
-        WHERE record_date BETWEEN '2025-09-20' AND '2025-12-10'
-        ORDER BY record_date ASC
-    """
-    
+    dates = []
+    wind_speeds = []
+    severity_scores = []
+
+    # daily max wind and severity from the summary table, which the fetch
+    # and process steps keep current (this script only reads); the points
+    # are cached until the summary changes
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='daily_weather_summary'").fetchone():
+        print("Missing table: daily_weather_summary. Run process_weather_data(Zuming).py first.")
+        conn.close()
+        return
     try:
-        cursor.execute(sql_query)
-        rows = cursor.fetchall()
+        rows = cached_query(conn, """
+            SELECT date, max_wind_speed, severity_score
+            FROM daily_weather_summary
+            WHERE date BETWEEN '2025-09-20' AND '2025-12-10'
+            ORDER BY date ASC
+        """, (), ["daily_weather_summary"])
+        for date_str, daily_max_wind, score in rows:
+            dates.append(date_str)
+            wind_speeds.append(daily_max_wind)
+            severity_scores.append(score)
     except Exception as e:
         print(f"Database error: {e}")
         conn.close()
@@ -26,56 +37,11 @@ def visualize_weather_impact(db_path):
 
     conn.close()
 
-    if not rows:
+    if not dates:
         print("No data found for the specified date range.")
         return
 
-    dates = []
-    wind_speeds = []
-    severity_scores = []
-
-    # process raw json data
-    for row in rows:
-        date_str = row[0]
-        json_str = row[1]
-        
-        if not json_str:
-            continue
-            
-        try:
-            data = json.loads(json_str)
-            hourly_list = data.get('hourly', [])
-            
-            # calculate max wind speed and total precip for this day
-            daily_max_wind = 0
-            daily_total_precip = 0.0
-            
-            for h in hourly_list:
-                # get wind speed
-                w = int(h.get('wind_speed', 0))
-                if w > daily_max_wind:
-                    daily_max_wind = w
-                
-                # get precipitation
-                p = float(h.get('precip', 0.0))
-                daily_total_precip = daily_total_precip + p
-            
-            # calculate severity score
-            # Formula: (Wind * 0.5) + (Precip * 2.0)
-            score = (daily_max_wind * 0.5) + (daily_total_precip * 2.0)
-            
-            dates.append(date_str)
-            wind_speeds.append(daily_max_wind)
-            severity_scores.append(score)
-            
-        except Exception:
-            continue
-
     # create plot
-    if not dates:
-        print("No valid data to plot.")
-        return
-
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10))
 
     # plot wind speed
@@ -110,4 +76,5 @@ if __name__ == "__main__":
     base_dir = os.path.dirname(os.path.abspath(__file__))
     DB_FILE = os.path.join(base_dir, "weather_data.db")
     
-    visualize_weather_impact(DB_FILE)
\ No newline at end of file
+    with get_metrics().stage("visualize_weather_impact"):
+        visualize_weather_impact(DB_FILE)
\ No newline at end of file
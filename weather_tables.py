@@ -0,0 +1,207 @@
+"""
+Typed weather tables derived from weatherstack's hourly data.
+
+weather_hourly: one row per (location, record_date, hour), written by the
+weather fetcher's save_to_db, so analytics can use indexed SQL instead of
+json.loads on every full_data_json payload. A day is always rewritten as a
+whole with fresh AUTOINCREMENT ids.
+
+weather_hourly_days: one row per (location, record_date) save_hourly has
+written, re-issued under a new AUTOINCREMENT id on every rewrite, including
+one that leaves the day with no hours (which moves no weather_hourly id).
+"id > last seen id" therefore finds every changed day; the incremental
+aggregates and main.py merge follow it.
+
+daily_weather_summary: one row per (date, location) with the day's max
+wind, total precip and severity score, derived from weather_hourly and
+refreshed incrementally (only days logged above the last seen
+weather_hourly_days id are recomputed). The date-leading primary key makes
+the wind-vs-delay join in visualisation(Ke).py an index lookup.
+
+Existing databases are filled by backfill_weather_hourly(), which only
+touches weather_history days save_hourly has not written yet, followed by
+refresh_daily_weather_summary():
+    python weather_tables.py weather_data.db
+"""
+
+import sqlite3
+import sys
+
+from db_utils import create_index
+from payload_store import payload_query, decode_payload
+
+
+def create_weather_hourly_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS weather_hourly (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            location TEXT,
+            record_date TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            temperature REAL,
+            wind_speed INTEGER,
+            wind_dir TEXT,
+            precip REAL,
+            humidity INTEGER,
+            visibility INTEGER,
+            pressure INTEGER,
+            UNIQUE(location, record_date, hour)
+        )
+    ''')
+    create_index(conn, "idx_weather_hourly_date")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS weather_hourly_days (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            location TEXT,
+            record_date TEXT NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_weather_hourly_days_date ON weather_hourly_days(record_date)")
+
+
+def hourly_rows(location, date_str, details):
+    # same conversions the processing scripts always applied to the raw json
+    rows = []
+    for h in details.get('hourly', []) or []:
+        rows.append((
+            location,
+            date_str,
+            int(h.get('time', 0)) // 100,
+            h.get('temperature'),
+            int(h.get('wind_speed', 0)),
+            h.get('wind_dir'),
+            float(h.get('precip', 0.0)),
+            h.get('humidity'),
+            h.get('visibility'),
+            h.get('pressure'),
+        ))
+    return rows
+
+
+def save_hourly(conn, location, date_str, details):
+    """Replace the hourly rows of one day (caller commits)."""
+    rows = hourly_rows(location, date_str, details)
+    conn.execute("DELETE FROM weather_hourly WHERE location IS ? AND record_date = ?", (location, date_str))
+    conn.executemany('''
+        INSERT INTO weather_hourly
+        (location, record_date, hour, temperature, wind_speed, wind_dir, precip, humidity, visibility, pressure)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    # log the day under a new id, also when it now has no hours
+    conn.execute("DELETE FROM weather_hourly_days WHERE record_date = ? AND location IS ?", (date_str, location))
+    conn.execute("INSERT INTO weather_hourly_days (location, record_date) VALUES (?, ?)", (location, date_str))
+
+
+def changed_days(conn, high_water):
+    """(location, record_date) of days rewritten since high_water, plus the new mark."""
+    new_high_water = conn.execute("SELECT MAX(id) FROM weather_hourly_days").fetchone()[0] or 0
+    if new_high_water <= high_water:
+        return [], high_water
+    days = conn.execute(
+        "SELECT location, record_date FROM weather_hourly_days WHERE id > ?", (high_water,)
+    ).fetchall()
+    return days, new_high_water
+
+
+def backfill_weather_hourly(conn, batch_size=200):
+    """Fill weather_hourly for weather_history days save_hourly has never written."""
+    create_weather_hourly_table(conn)
+    days = 0
+    last_id = 0
+    # walk weather_history by id, batch_size days at a time, so memory does
+    # not grow with the table
+    while True:
+        rows = conn.execute(payload_query(conn, "weather_history", "h.id, h.location, h.record_date", '''
+            WHERE h.id > ? AND h.record_date IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM weather_hourly_days w
+                WHERE w.record_date = h.record_date AND w.location IS h.location
+            )
+            ORDER BY h.id LIMIT ?
+        '''), (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        with conn:
+            for _, location, date_str, *payload in rows:
+                try:
+                    details = decode_payload(*payload)
+                    if details:
+                        save_hourly(conn, location, date_str, details)
+                        days += 1
+                except (ValueError, TypeError):
+                    # malformed payloads were skipped by the old json readers too
+                    continue
+    conn.commit()
+    return days
+
+
+def create_daily_weather_summary_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_weather_summary (
+            date TEXT NOT NULL,
+            location TEXT,
+            max_wind_speed INTEGER,
+            total_precip REAL,
+            severity_score REAL,
+            PRIMARY KEY (date, location)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_weather_summary_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            high_water INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO daily_weather_summary_state (id, high_water) VALUES (1, 0)")
+
+
+def severity_score(max_wind, total_precip):
+    # Formula: (Wind * 0.5) + (Precip * 2.0)
+    return (max_wind * 0.5) + (total_precip * 2.0)
+
+
+def refresh_daily_weather_summary(conn):
+    """Recompute the summary for days rewritten since the last refresh; returns days updated (caller commits)."""
+    create_weather_hourly_table(conn)
+    create_daily_weather_summary_table(conn)
+    high_water = conn.execute("SELECT high_water FROM daily_weather_summary_state WHERE id = 1").fetchone()[0]
+    touched, new_high_water = changed_days(conn, high_water)
+    if not touched:
+        return 0
+
+    for location, date_str in touched:
+        hours, daily_max_wind, daily_total_precip = conn.execute('''
+            SELECT COUNT(*), MAX(wind_speed), SUM(precip) FROM weather_hourly
+            WHERE location IS ? AND record_date = ?
+        ''', (location, date_str)).fetchone()
+        conn.execute("DELETE FROM daily_weather_summary WHERE date = ? AND location IS ?", (date_str, location))
+        if not hours:
+            # rewritten to no hours: the day drops out of the summary
+            continue
+        daily_max_wind = max(daily_max_wind or 0, 0)
+        daily_total_precip = daily_total_precip or 0.0
+        conn.execute('''
+            INSERT INTO daily_weather_summary (date, location, max_wind_speed, total_precip, severity_score)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (date_str, location, daily_max_wind, daily_total_precip,
+              severity_score(daily_max_wind, daily_total_precip)))
+
+    conn.execute("UPDATE daily_weather_summary_state SET high_water = ? WHERE id = 1", (new_high_water,))
+    return len(touched)
+
+
+def ensure_weather_hourly(conn):
+    """Make sure weather_hourly exists and covers weather_history (no-op once it does)."""
+    days = backfill_weather_hourly(conn)
+    if days:
+        print(f"weather_hourly: backfilled {days} days from weather_history")
+    return days
+
+
+if __name__ == "__main__":
+    db_file = sys.argv[1] if len(sys.argv) > 1 else "weather_data.db"
+    connection = sqlite3.connect(db_file)
+    print(f"Backfilled {backfill_weather_hourly(connection)} days into weather_hourly ({db_file})")
+    with connection:
+        print(f"Refreshed {refresh_daily_weather_summary(connection)} days of daily_weather_summary")
+    connection.close()